@@ -4,33 +4,101 @@
 # 本文件只允许依赖math库
 import math
 
+# 可替换的内核实现，后端名 -> {内核名: 函数}。'python'即本文件中的纯Python实现，
+# 其他后端（例如cg_jit注册的'numba'）由依赖对应库的模块在导入时注册，这里不导入它们
+_backends = {'python': {}}
+_backend = 'python'
+_kernels = _backends['python']
 
-def draw_line(p_list, algorithm):
+
+def register_backend(name, kernels):
+    """注册一组内核实现
+
+    :param name: (string) 后端名
+    :param kernels: (dict) 内核名 -> 函数，可以包含'line'(p_list, algorithm, out=None)、'ellipse'(p_list, out=None)和
+                    'curve'(p_list, algorithm, n_steps, out=None)，out与返回值同draw_line、draw_ellipse、draw_curve；
+                    缺少的内核仍使用纯Python实现
+    """
+    _backends[name] = kernels
+
+
+def set_backend(name):
+    """选择绘制使用的后端，没有注册的后端（例如没有安装Numba）静默地退回'python'
+
+    :param name: (string) 后端名
+    :return: (string) 实际使用的后端名
+    """
+    global _backend, _kernels
+    if name not in _backends:
+        name = 'python'
+    _backend, _kernels = name, _backends[name]
+    return name
+
+
+def get_backend():
+    """当前使用的后端名"""
+    return _backend
+
+
+def _append_line(result, p_list, algorithm, out, seen=None):
+    """把一条线段的像素追加到result（列表模式）或直接写入out（紧凑模式），避免列表拼接
+
+    seen不为None时只追加不在seen中的像素，并把它们加入seen，使每个像素只输出一次
+    """
+    if seen is None:
+        if out is None:
+            result.extend(draw_line(p_list, algorithm))
+        else:
+            draw_line(p_list, algorithm, out)
+        return
+    emit = result.append if out is None else out.extend
+    for x, y in draw_line(p_list, algorithm):
+        if (x, y) not in seen:
+            seen.add((x, y))
+            emit([x, y])
+
+
+def draw_line(p_list, algorithm, out=None):
     """绘制线段
 
     :param p_list: (list of list of int: [[x0, y0], [x1, y1]]) 线段的起点和终点坐标
     :param algorithm: (string) 绘制使用的算法，包括'DDA'和'Bresenham'，此处的'Naive'仅作为示例，测试时不会出现
+    :param out: (array of int, 可选) 紧凑输出缓冲区，给出时像素按x_0, y_0, x_1, y_1, ...追加到其中并返回out。
+                out可以是任何支持extend的整数缓冲区，例如array('i')，
+                写入后可用numpy.frombuffer(out, numpy.int32).reshape(-1, 2)得到(N, 2)的数组
     :return: (list of list of int: [[x_0, y_0], [x_1, y_1], [x_2, y_2], ...]) 绘制结果的像素点坐标列表
     """
+    kernel = _kernels.get('line')
+    if kernel is not None and (algorithm == 'DDA' or algorithm == 'Bresenham'):
+        return kernel(p_list, algorithm, out)
+    if out is None:
+        return list(_line_points(p_list, algorithm))
+    # 紧凑模式下每个像素直接写入out，不生成像素列表
+    for p in _line_points(p_list, algorithm):
+        out.extend(p)
+    return out
+
+
+def _line_points(p_list, algorithm):
+    """依次生成draw_line的像素（纯Python实现），参数同draw_line"""
     x0, y0 = p_list[0]
     x1, y1 = p_list[1]
-    result = []
     if algorithm == 'Naive':
         if x0 == x1:
             if y0 > y1:
                 x0, y0, x1, y1 = x1, y1, x0, y0
             for y in range(y0, y1 + 1):
-                result.append([x0, y])
+                yield [x0, y]
         else:
             if x0 > x1:
                 x0, y0, x1, y1 = x1, y1, x0, y0
             k = (y1 - y0) / (x1 - x0)
             for x in range(x0, x1 + 1):
-                result.append([x, int(y0 + k * (x - x0))])
+                yield [x, int(y0 + k * (x - x0))]
     elif algorithm == 'DDA':
         if y1 == y0 and x1 == x0:
             # 两个端点重合，可能不算线段，但是保险起见我特判一下吧
-            result.append([x0, y0])
+            yield [x0, y0]
         elif abs(y1 - y0) <= abs(x1 - x0):
             # 若线段斜率绝对值小于等于1，则x方向取样
             k = (y1 - y0) / (x1 - x0)
@@ -38,7 +106,7 @@ def draw_line(p_list, algorithm):
                 x0, y0, x1, y1 = x1, y1, x0, y0
             y = y0
             for x in range(x0, x1 + 1):
-                result.append([int(x), int(y)])
+                yield [int(x), int(y)]
                 y = y + k
         else:  # abs(y1 - y0) > abs(x1 - x0)
             # 若线段斜率绝对值大于1(或者斜率不存在)， 则y方向取样
@@ -48,16 +116,16 @@ def draw_line(p_list, algorithm):
                 x0, y0, x1, y1 = x1, y1, x0, y0
             x = x0
             for y in range(y0, y1 + 1):
-                result.append([int(x), int(y)])
+                yield [int(x), int(y)]
                 x = x + k
     elif algorithm == 'Bresenham':
         dx, dy = abs(x1 - x0), abs(y1 - y0)
         if dx == 0:
             for y in range(min(y0, y1), max(y0, y1) + 1):
-                result.append([x0, y])
+                yield [x0, y]
         elif dy == 0:
             for x in range(min(x0, x1), max(x0, x1) + 1):
-                result.append([x, y0])
+                yield [x, y0]
         elif dx == dy:  # 对角线
             if x0 > x1:
                 x0, y0, x1, y1 = x1, y1, x0, y0
@@ -66,7 +134,7 @@ def draw_line(p_list, algorithm):
             else:
                 uy = -1
             for x in range(0, dx + 1):
-                result.append([x0 + x, y0 + uy * x])
+                yield [x0 + x, y0 + uy * x]
         elif dy < dx:  # |m| < 1
             dx2, dy2 = 2 * dx, 2 * dy
             if x0 > x1:
@@ -79,14 +147,14 @@ def draw_line(p_list, algorithm):
             # uy是y更新的增量方向
             y = y0
             p = 2 * dy - dx
-            result.append([x0, y0])
+            yield [x0, y0]
             for x in range(x0 + 1, x1 + 1):
                 if p <= 0:
                     p = p + dy2
                 else:  # p > 0
                     y = y + uy
                     p = p + dy2 - dx2
-                result.append([x, y])
+                yield [x, y]
         else:  # |m| > 1
             dx2, dy2 = 2 * dx, 2 * dy
             if y0 > y1:
@@ -99,171 +167,734 @@ def draw_line(p_list, algorithm):
             # ux是x更新的增量方向
             x = x0
             p = 2 * dx - dy  # 决策参数p
-            result.append([x0, y0])
+            yield [x0, y0]
             for y in range(y0 + 1, y1 + 1):
                 if p < 0:
                     p = p + dx2
                 else:  # p >= 0
                     x = x + ux
                     p = p + dx2 - dy2
-                result.append([x, y])
-    return result
+                yield [x, y]
 
 
-def draw_polygon(p_list, algorithm):
+def draw_polygon(p_list, algorithm, out=None, unique=False):
     """绘制多边形
 
     :param p_list: (list of list of int: [[x0, y0], [x1, y1], [x2, y2], ...]) 多边形的顶点坐标列表
     :param algorithm: (string) 绘制使用的算法，包括'DDA'和'Bresenham'
+    :param out: (array of int, 可选) 紧凑输出缓冲区，同draw_line
+    :param unique: (bool) 为True时去掉重复的像素，每个像素只按第一次出现的顺序输出一次
     :return: (list of list of int: [[x_0, y_0], [x_1, y_1], [x_2, y_2], ...]) 绘制结果的像素点坐标列表
     """
     result = []
+    seen = set() if unique else None
     for i in range(len(p_list)):
-        line = draw_line([p_list[i - 1], p_list[i]], algorithm)
-        result += line
-    return result
+        _append_line(result, [p_list[i - 1], p_list[i]], algorithm, out, seen)
+    return result if out is None else out
 
 
-def draw_polyline(p_list, algorithm):
+def draw_polyline(p_list, algorithm, out=None, unique=False):
     """绘制折线
 
     :param p_list: (list of list of int: [[x0, y0], [x1, y1], [x2, y2], ...]) 多边形的顶点坐标列表
     :param algorithm: (string) 绘制使用的算法，包括'DDA'和'Bresenham'
+    :param out: (array of int, 可选) 紧凑输出缓冲区，同draw_line
+    :param unique: (bool) 为True时去掉重复的像素，每个像素只按第一次出现的顺序输出一次
     :return: (list of list of int: [[x_0, y_0], [x_1, y_1], [x_2, y_2], ...]) 绘制结果的像素点坐标列表
     """
     result = []
+    seen = set() if unique else None
     for i in range(1, len(p_list)):
-        line = draw_line([p_list[i - 1], p_list[i]], algorithm)
-        result += line
-    return result
+        _append_line(result, [p_list[i - 1], p_list[i]], algorithm, out, seen)
+    return result if out is None else out
+
+
+def _draw_circle(cx, cy, r, out=None):
+    """中点圆生成算法，从(0, r)出发沿顺时针计算到45°，每一步按8路对称输出8个像素
+
+    :param cx: (int) 圆心x坐标
+    :param cy: (int) 圆心y坐标
+    :param r: (int) 半径
+    :param out: (array of int, 可选) 紧凑输出缓冲区，同draw_line
+    :return: (list of list of int: [[x_0, y_0], [x_1, y_1], [x_2, y_2], ...]) 绘制结果的像素点坐标列表
+    """
+    result = []
+    emit = result.append if out is None else out.extend
+    x, y = 0, r
+    p = 5 - 4 * r  # 4 (5/4 - r)
+    while True:
+        emit([cx + x, cy + y])
+        emit([cx - x, cy + y])
+        emit([cx + x, cy - y])
+        emit([cx - x, cy - y])
+        emit([cx + y, cy + x])
+        emit([cx - y, cy + x])
+        emit([cx + y, cy - x])
+        emit([cx - y, cy - x])
+        if y <= x:
+            break
+        x = x + 1
+        if p < 0:
+            p = p + 8 * x + 4
+        else:
+            y = y - 1
+            p = p + 8 * x - 8 * y + 4
+    return result if out is None else out
 
 
-def draw_ellipse(p_list):
+def draw_ellipse(p_list, out=None):
     """绘制椭圆（采用中点圆生成算法）
 
     :param p_list: (list of list of int: [[x0, y0], [x1, y1]]) 椭圆的矩形包围框左上角和右下角顶点坐标
+    :param out: (array of int, 可选) 紧凑输出缓冲区，同draw_line
     :return: (list of list of int: [[x_0, y_0], [x_1, y_1], [x_2, y_2], ...]) 绘制结果的像素点坐标列表
     """
     # print(p_list)
     result = []
+    emit = result.append if out is None else out.extend
     x0, y0, x1, y1 = p_list[0][0], p_list[0][1], p_list[1][0], p_list[1][1]
     if y0 == y1:
         # print("嘤")
-        return draw_line(p_list, 'Bresenham')
-    cx, cy = (x0 + x1) / 2, (y0 + y1) / 2
-    rx, ry = abs(x1 - x0) / 2, abs(y1 - y0) / 2
+        return draw_line(p_list, 'Bresenham', out)
+    kernel = _kernels.get('ellipse')
+    if kernel is not None:
+        return kernel(p_list, out)
+    if abs(x1 - x0) == abs(y1 - y0) and (x1 - x0) % 2 == 0:
+        # 圆心和半径都是整数的圆，只算1/8圆弧，其余由对称性得到
+        return _draw_circle((x0 + x1) // 2, (y0 + y1) // 2, abs(x1 - x0) // 2, out)
+    # 中心和半径可能是半整数，全部使用2倍坐标，判别式乘16后只有整数运算
     # 椭圆方程为 (x - cx)^2 / rx^2 + (y - cy)^2 / ry^2 = 1 (无论焦点在x轴y轴)
-    x, y = 0, ry
-    result.append([int(cx + x), int(cy + y)])
-    result.append([int(cx - x), int(cy - y)])
-    p1 = ry * ry - rx * rx * ry + rx * rx / 4
-    while rx * rx * y > ry * ry * x:
-        # print('1:', x, y, p1)
-        result.append([int(cx + x), int(cy + y)])
-        result.append([int(cx - x), int(cy + y)])
-        result.append([int(cx + x), int(cy - y)])
-        result.append([int(cx - x), int(cy - y)])
+    sx, sy = x0 + x1, y0 + y1  # 2cx, 2cy
+    a, b = abs(x1 - x0), abs(y1 - y0)  # 2rx, 2ry
+    aa, bb = a * a, b * b
+    # 像素坐标int(cx + x) = int((sx + 2x) / 2)，(v + (v < 0)) >> 1即向零取整的v / 2
+    x, y2 = 0, b  # y2 = 2y
+    u, v = sy + y2, sy - y2
+    emit([(sx + (sx < 0)) >> 1, (u + (u < 0)) >> 1])
+    emit([(sx + (sx < 0)) >> 1, (v + (v < 0)) >> 1])
+    # p1 = ry^2 - rx^2 ry + rx^2 / 4
+    p1 = 4 * bb - 2 * aa * b + aa
+    while aa * y2 > 2 * bb * x:  # rx^2 y > ry^2 x
+        u, v = sx + 2 * x, sx - 2 * x
+        xr, xl = (u + (u < 0)) >> 1, (v + (v < 0)) >> 1
+        u, v = sy + y2, sy - y2
+        yt, yb = (u + (u < 0)) >> 1, (v + (v < 0)) >> 1
+        emit([xr, yt])
+        emit([xl, yt])
+        emit([xr, yb])
+        emit([xl, yb])
+        x = x + 1
         if p1 < 0:
-            x, y = x + 1, y
-            p1 = p1 + 2 * ry * ry * x + ry * ry
+            p1 = p1 + 8 * bb * x + 4 * bb
         else:
-            x, y = x + 1, y - 1
-            p1 = p1 + 2 * ry * ry * x - 2 * rx * rx * y + ry * ry
-    p2 = ry * ry * (x + 1 / 2) * (x + 1 / 2) + rx * rx * (y - 1) * (y - 1) - rx * rx * ry * ry
-    while y >= 0:
-        # print('2:', x, y, p2)
-        result.append([int(cx + x), int(cy + y)])
-        result.append([int(cx - x), int(cy + y)])
-        result.append([int(cx + x), int(cy - y)])
-        result.append([int(cx - x), int(cy - y)])
+            y2 = y2 - 2
+            p1 = p1 + 8 * bb * x - 4 * aa * y2 + 4 * bb
+    # p2 = ry^2 (x + 1/2)^2 + rx^2 (y - 1)^2 - rx^2 ry^2
+    p2 = bb * (2 * x + 1) * (2 * x + 1) + aa * (y2 - 2) * (y2 - 2) - aa * bb
+    while y2 >= 0:
+        u, v = sx + 2 * x, sx - 2 * x
+        xr, xl = (u + (u < 0)) >> 1, (v + (v < 0)) >> 1
+        u, v = sy + y2, sy - y2
+        yt, yb = (u + (u < 0)) >> 1, (v + (v < 0)) >> 1
+        emit([xr, yt])
+        emit([xl, yt])
+        emit([xr, yb])
+        emit([xl, yb])
+        y2 = y2 - 2
         if p2 > 0:
-            x, y = x, y - 1
-            p2 = p2 - 2 * rx * rx * y + rx * rx
+            p2 = p2 - 4 * aa * y2 + 4 * aa
         else:
-            x, y = x + 1, y - 1
-            p2 = p2 + 2 * ry * ry * x - 2 * rx * rx * y + rx * rx
-    while x <= rx:
-        result.append([int(cx + x), int(cy)])
-        result.append([int(cx - x), int(cy)])
+            x = x + 1
+            p2 = p2 + 8 * bb * x - 4 * aa * y2 + 4 * aa
+    yc = (sy + (sy < 0)) >> 1
+    while 2 * x <= a:  # x <= rx
+        u, v = sx + 2 * x, sx - 2 * x
+        emit([(u + (u < 0)) >> 1, yc])
+        emit([(v + (v < 0)) >> 1, yc])
         x = x + 1
-    return result
+    return result if out is None else out
 
 
-def draw_curve(p_list, algorithm, n_steps=1000):
-    """绘制曲线
+# Bezier基函数表的缓存, (n, n_steps) -> 表, 按最近使用的顺序排列, 超出容量时淘汰最久未用的
+BEZIER_CACHE_SIZE = 16
+_bezier_basis_cache = {}
 
-    :param p_list: (list of list of int: [[x0, y0], [x1, y1], [x2, y2], ...]) 曲线的控制点坐标列表
-    :param algorithm: (string) 绘制使用的算法，包括'Bezier'和'B-spline'（三次均匀B样条曲线，曲线不必经过首末控制点）
+
+def _bezier_basis(n, n_steps):
+    """n次Bernstein基函数在u = t / n_steps (t = 0, 1, ..., n_steps)处的取值表
+
+    :param n: (int) Bezier曲线的次数
     :param n_steps: (int) 采样的点的个数
-    :return: (list of list of int: [[x_0, y_0], [x_1, y_1], [x_2, y_2], ...]) 绘制结果的像素点坐标列表
+    :return: (list of tuple of float) 第t行为(B[0][n](u), B[1][n](u), ..., B[n][n](u))
     """
-    result = []
-    n = len(p_list) - 1  # n次Bezier曲线, n+1个控制点
-    if algorithm == "Bezier":
-        # u = 0
-        # step = 0.00005
-        # step = 1 / n_steps  # 默认0.001
-        points = []
-        # p = []
-        # for i in range(0, n + 1):
-        #     p.append([p_list[i][0], p_list[i][1]])
-        # while u <= 1:
+    key = (n, n_steps)
+    table = _bezier_basis_cache.pop(key, None)
+    if table is None:
+        table = []
         for t in range(0, n_steps + 1):
             u = t / n_steps
-            p = []
-            for i in range(0, n + 1):
-                p.append([p_list[i][0], p_list[i][1]])
-            # 使用de Casteljau算法,
-            # P[i][r] = (1 - u) P[i][r - 1] + u P[i + 1][r - 1]
-            # 曲线上的点为P(u) = P[0][n]
+            # 与de Casteljau算法相同的递推: B[i][r] = (1 - u) B[i][r - 1] + u B[i - 1][r - 1]
+            b = [1.0]
             for r in range(1, n + 1):
-                for i in range(0, n - r + 1):
-                    p[i][0] = (1 - u) * p[i][0] + u * p[i + 1][0]
-                    p[i][1] = (1 - u) * p[i][1] + u * p[i + 1][1]
-            # u = u + step
-            # result.append([int(p[0][0]), int(p[0][1])])
-            if len(points) == 0:
-                result.append([int(p[0][0]), int(p[0][1])])
-            else:
-                result += draw_line([points[-1], [int(p[0][0]), int(p[0][1])]], 'Bresenham')
-            points.append([int(p[0][0]), int(p[0][1])])
-        # print(result)
-        return result
+                b = [(1 - u) * b[0]] + [(1 - u) * b[i] + u * b[i - 1] for i in range(1, r)] + [u * b[r - 1]]
+            table.append(tuple(b))
+        if len(_bezier_basis_cache) >= BEZIER_CACHE_SIZE:
+            del _bezier_basis_cache[next(iter(_bezier_basis_cache))]
+    _bezier_basis_cache[key] = table
+    return table
+
+
+def _de_casteljau(p_list, u):
+    """使用de Casteljau算法计算Bezier曲线在参数u处的点
+
+    :param p_list: (list of list of int: [[x0, y0], [x1, y1], [x2, y2], ...]) 曲线的控制点坐标列表
+    :param u: (float) 参数, 0 <= u <= 1
+    :return: (list of float: [x, y]) 曲线上的点
+    """
+    n = len(p_list) - 1
+    p = []
+    for i in range(0, n + 1):
+        p.append([p_list[i][0], p_list[i][1]])
+    # P[i][r] = (1 - u) P[i][r - 1] + u P[i + 1][r - 1]
+    # 曲线上的点为P(u) = P[0][n]
+    for r in range(1, n + 1):
+        for i in range(0, n - r + 1):
+            p[i][0] = (1 - u) * p[i][0] + u * p[i + 1][0]
+            p[i][1] = (1 - u) * p[i][1] + u * p[i + 1][1]
+    return p[0]
+
+
+# 三次均匀B样条的基矩阵(已乘6), 第j段曲线为 P(t) = [t^3, t^2, t, 1] M [P[j-3], P[j-2], P[j-1], P[j]]^T / 6
+B_SPLINE_MATRIX = ((-1, 3, -3, 1),
+                   (3, -6, 3, 0),
+                   (-3, 0, 3, 0),
+                   (1, 4, 1, 0))
+
+
+def _b_spline_weights(t):
+    """三次均匀B样条在局部参数t处四个非零基函数的值, 即[t^3, t^2, t, 1] M / 6"""
+    return [(((m0 * t + m1) * t + m2) * t + m3) / 6 for m0, m1, m2, m3 in zip(*B_SPLINE_MATRIX)]
+
+
+def _cox_de_boor(p_list, u):
+    """使用Cox-de Boor递推计算三次均匀B样条曲线在参数u处的点
+
+    :param p_list: (list of list of int: [[x0, y0], [x1, y1], [x2, y2], ...]) 曲线的控制点坐标列表
+    :param u: (float) 参数, 3 <= u <= n + 1
+    :return: (list of float: [x, y]) 曲线上的点
+    """
+    n = len(p_list) - 1
+    # P(u) = sum_{i=0}^n P[i]B[i][4](u), u in [k, n+1]
+    # 首先计算B[i][1]: (0 <= i <= n + k) 即0 <= i <= n + 3
+    # if u in [i, i+1), B[i][1] = 1; else B[i][1] = 0
+    b = []
+    for i in range(0, n + 4):
+        if i <= u < i + 1:
+            b.append(1)
+        else:
+            b.append(0)
+    # k > 1时, B[i][k](u) = (u-i)/(k-1) N[i][k-1](u)
+    #                       + (i+k-u)/(k-1) N[i+1][k-1](u)
+    # 最终求得 B[i][4](u), 0 <= i <= n
+    for k in range(2, 5):
+        for i in range(0, n + 5 - k):
+            b[i] = b[i] * (u - i) / (k - 1) + b[i + 1] * (i + k - u) / (k - 1)
+    x, y = 0, 0
+    for i in range(0, n + 1):
+        x = x + p_list[i][0] * b[i]
+        y = y + p_list[i][1] * b[i]
+    return [x, y]
+
+
+def _split_bezier(ctrl):
+    """用de Casteljau算法在u = 1/2处把Bezier曲线分成两段, 返回两段各自的控制点"""
+    left, right = [ctrl[0]], [ctrl[-1]]
+    p = ctrl
+    while len(p) > 1:
+        p = [[(a[0] + b[0]) / 2, (a[1] + b[1]) / 2] for a, b in zip(p, p[1:])]
+        left.append(p[0])
+        right.append(p[-1])
+    right.reverse()
+    return left, right
+
+
+def _bezier_flatness(ctrl):
+    """控制多边形的内部顶点到首末点连线的最大距离，由凸包性，曲线与该连线的偏差不超过此值"""
+    x0, y0 = ctrl[0]
+    x1, y1 = ctrl[-1]
+    dx, dy = x1 - x0, y1 - y0
+    length = math.sqrt(dx * dx + dy * dy)
+    d = 0
+    for x, y in ctrl[1:-1]:
+        if length == 0:
+            d = max(d, math.sqrt((x - x0) * (x - x0) + (y - y0) * (y - y0)))
+        else:
+            d = max(d, abs((x - x0) * dy - (y - y0) * dx) / length)
+    return d
+
+
+def _flatten_bezier(ctrl, tolerance, points, max_depth=16):
+    """自适应细分Bezier曲线，直到每一段与其弦的偏差不超过tolerance，把各段终点依次加入points"""
+    stack = [(ctrl, 0)]
+    while stack:
+        c, depth = stack.pop()
+        if depth >= max_depth or _bezier_flatness(c) <= tolerance:
+            points.append(c[-1])
+        else:
+            left, right = _split_bezier(c)
+            stack.append((right, depth + 1))
+            stack.append((left, depth + 1))
+
+
+def _flatten_curve(p_list, algorithm, tolerance):
+    """把曲线自适应地展平为折线顶点
+
+    :param p_list: (list of list of int: [[x0, y0], [x1, y1], [x2, y2], ...]) 曲线的控制点坐标列表
+    :param algorithm: (string) 'Bezier'或'B-spline'
+    :param tolerance: (float) 允许的最大偏差(像素)
+    :return: (list of list of float: [[x_0, y_0], [x_1, y_1], ...]) 折线顶点
+    """
+    points = []
+    if algorithm == "Bezier":
+        points.append(p_list[0])
+        _flatten_bezier(p_list, tolerance, points)
+    elif algorithm == "B-spline":
+        # 三次均匀B样条的每一段都可以精确地写成一段三次Bezier曲线
+        for j in range(3, len(p_list)):
+            p0, p1, p2, p3 = p_list[j - 3:j + 1]
+            ctrl = [[(p0[k] + 4 * p1[k] + p2[k]) / 6 for k in range(2)],
+                    [(2 * p1[k] + p2[k]) / 3 for k in range(2)],
+                    [(p1[k] + 2 * p2[k]) / 3 for k in range(2)],
+                    [(p1[k] + 4 * p2[k] + p3[k]) / 6 for k in range(2)]]
+            if not points:
+                points.append(ctrl[0])
+            _flatten_bezier(ctrl, tolerance, points)
+    return points
+
+
+def _curve_points(p_list, algorithm, n_steps, tolerance):
+    """依次生成draw_curve用直线连接的曲线采样点（已取整），参数同draw_curve"""
+    n = len(p_list) - 1  # n次Bezier曲线, n+1个控制点
+    if tolerance is not None:
+        # 工作量与曲线在屏幕上的长度成正比，而与n_steps无关
+        last = None
+        for x, y in _flatten_curve(p_list, algorithm, tolerance):
+            point = [int(x), int(y)]
+            if point != last:
+                yield point
+                last = point
+    elif algorithm == "Bezier":
+        # P(u) = sum_{i=0}^n P[i] B[i][n](u), 基函数表对同样的(n, n_steps)只计算一次
+        basis = _bezier_basis(n, n_steps)
+        xs = [p[0] for p in p_list]
+        ys = [p[1] for p in p_list]
+        for t in range(0, n_steps + 1):
+            b = basis[t]
+            x, y = sum([bi * xi for bi, xi in zip(b, xs)]), sum([bi * yi for bi, yi in zip(b, ys)])
+            if abs(x - round(x)) < 1e-6 or abs(y - round(y)) < 1e-6:
+                # 矩阵形式与de Casteljau算法只有舍入误差的差别，只在取整结果可能不同的点上重新计算
+                x, y = _de_casteljau(p_list, t / n_steps)
+            yield [int(x), int(y)]
     elif algorithm == "B-spline":  # 三次均匀B样条曲线, 4阶. k = 3
         # step = 0.0001
         if n < 3:
-            return []
+            return
         step = (n - 2) / n_steps  # 默认1000
         u = 3
-        points = []
         while u <= n + 1:
-            # P(u) = sum_{i=0}^n P[i]B[i][4](u), u in [k, n+1]
-            # 首先计算B[i][1]: (0 <= i <= n + k) 即0 <= i <= n + 3
-            # if u in [i, i+1), B[i][1] = 1; else B[i][1] = 0
-            b = []
-            for i in range(0, n + 4):
-                if i <= u < i + 1:
-                    b.append(1)
-                else:
-                    b.append(0)
-            # k > 1时, B[i][k](u) = (u-i)/(k-1) N[i][k-1](u)
-            #                       + (i+k-u)/(k-1) N[i+1][k-1](u)
-            # 最终求得 B[i][4](u), 0 <= i <= n
-            for k in range(2, 5):
-                for i in range(0, n + 5 - k):
-                    b[i] = b[i] * (u - i) / (k - 1) + b[i + 1] * (i + k - u) / (k - 1)
-            x, y = 0, 0
-            for i in range(0, n + 1):
-                x = x + p_list[i][0] * b[i]
-                y = y + p_list[i][1] * b[i]
+            # u in [j, j+1)时只有B[j-3][4]...B[j][4]非零, 用局部参数t = u - j和均匀三次B样条的基矩阵计算
+            j = min(int(u), n)
+            t = u - j
+            w = _b_spline_weights(t)
+            x = p_list[j - 3][0] * w[0] + p_list[j - 2][0] * w[1] + p_list[j - 1][0] * w[2] + p_list[j][0] * w[3]
+            y = p_list[j - 3][1] * w[0] + p_list[j - 2][1] * w[1] + p_list[j - 1][1] * w[2] + p_list[j][1] * w[3]
+            if abs(x - round(x)) < 1e-6 or abs(y - round(y)) < 1e-6:
+                # 与Cox-de Boor递推只有舍入误差的差别，只在取整结果可能不同的点上重新计算
+                x, y = _cox_de_boor(p_list, u)
             u = u + step
-            # result.append([int(x), int(y)])
-            if len(points) == 0:
-                result.append([int(x), int(y)])
-            else:
-                result += draw_line([points[-1], [int(x), int(y)]], 'Bresenham')
-            points.append([int(x), int(y)])
-        return result
+            yield [int(x), int(y)]
+
+
+def draw_curve(p_list, algorithm, n_steps=1000, out=None, tolerance=None, unique=False):
+    """绘制曲线
+
+    :param p_list: (list of list of int: [[x0, y0], [x1, y1], [x2, y2], ...]) 曲线的控制点坐标列表
+    :param algorithm: (string) 绘制使用的算法，包括'Bezier'和'B-spline'（三次均匀B样条曲线，曲线不必经过首末控制点）
+    :param n_steps: (int) 采样的点的个数
+    :param out: (array of int, 可选) 紧凑输出缓冲区，同draw_line
+    :param tolerance: (float, 可选) 给出时改为自适应细分，每段与曲线的偏差不超过tolerance像素，忽略n_steps
+    :param unique: (bool) 为True时去掉重复的像素，每个像素只按第一次出现的顺序输出一次
+    :return: (list of list of int: [[x_0, y_0], [x_1, y_1], [x_2, y_2], ...]) 绘制结果的像素点坐标列表
+    """
+    result = []
+    seen = set() if unique else None
+    kernel = _kernels.get('curve')
+    if kernel is not None and tolerance is None:
+        if seen is None:
+            return kernel(p_list, algorithm, n_steps, out)
+        emit = result.append if out is None else out.extend
+        for x, y in kernel(p_list, algorithm, n_steps):
+            if (x, y) not in seen:
+                seen.add((x, y))
+                emit([x, y])
+        return result if out is None else out
+    last = None
+    for point in _curve_points(p_list, algorithm, n_steps, tolerance):
+        # 相邻采样点之间用直线连接
+        _append_line(result, [last or point, point], 'Bresenham', out, seen)
+        last = point
+    return result if out is None else out
+
+
+def _iter_segments(segments, algorithm, unique):
+    """依次生成各条线段的像素，同一时刻只保留一条线段的结果"""
+    seen = set() if unique else None
+    for segment in segments:
+        for x, y in draw_line(segment, algorithm):
+            if seen is not None:
+                if (x, y) in seen:
+                    continue
+                seen.add((x, y))
+            yield [x, y]
+
+
+def iter_polygon(p_list, algorithm, unique=False):
+    """逐个生成多边形的像素，顺序与draw_polygon相同
+
+    :param p_list: (list of list of int: [[x0, y0], [x1, y1], [x2, y2], ...]) 多边形的顶点坐标列表
+    :param algorithm: (string) 绘制使用的算法，包括'DDA'和'Bresenham'
+    :param unique: (bool) 同draw_polygon，去重需要记录已输出的像素
+    :return: (iterator of list of int: [x, y]) 像素点坐标
+    """
+    return _iter_segments(([p_list[i - 1], p_list[i]] for i in range(len(p_list))), algorithm, unique)
+
+
+def iter_polyline(p_list, algorithm, unique=False):
+    """逐个生成折线的像素，顺序与draw_polyline相同
+
+    :param p_list: (list of list of int: [[x0, y0], [x1, y1], [x2, y2], ...]) 折线的顶点坐标列表
+    :param algorithm: (string) 绘制使用的算法，包括'DDA'和'Bresenham'
+    :param unique: (bool) 同draw_polyline，去重需要记录已输出的像素
+    :return: (iterator of list of int: [x, y]) 像素点坐标
+    """
+    return _iter_segments(([p_list[i - 1], p_list[i]] for i in range(1, len(p_list))), algorithm, unique)
+
+
+def iter_curve(p_list, algorithm, n_steps=1000, tolerance=None, unique=False):
+    """逐个生成曲线的像素，顺序与draw_curve相同，采样点边算边输出；
+    注册了'curve'内核（例如'numba'后端）且不自适应细分时改为由内核一次算出整条曲线再逐个给出
+
+    :param p_list: (list of list of int: [[x0, y0], [x1, y1], [x2, y2], ...]) 曲线的控制点坐标列表
+    :param algorithm: (string) 绘制使用的算法，包括'Bezier'和'B-spline'
+    :param n_steps: (int) 采样的点的个数
+    :param tolerance: (float, 可选) 同draw_curve
+    :param unique: (bool) 同draw_curve，去重需要记录已输出的像素
+    :return: (iterator of list of int: [x, y]) 像素点坐标
+    """
+    if _kernels.get('curve') is not None and tolerance is None:
+        # 编译后端一次算出整条曲线
+        return iter(draw_curve(p_list, algorithm, n_steps, unique=unique))
+
+    def segments():
+        last = None
+        for point in _curve_points(p_list, algorithm, n_steps, tolerance):
+            yield [last or point, point]
+            last = point
+    return _iter_segments(segments(), 'Bresenham', unique)
+
+
+def iter_pixels(item_type, p_list, algorithm='', n_steps=1000, tolerance=None, unique=False):
+    """逐个生成图元的像素
+
+    线段、多边形、折线和曲线边算边输出，不在内存中保存完整结果（多边形、折线同一时刻保留一条边，
+    曲线在注册了'curve'内核时例外，见iter_curve）；椭圆的像素数只与周长成正比，整体算出后再逐个给出
+
+    :param item_type: (string) 'line'、'polygon'、'polyline'、'ellipse'或'curve'
+    :param p_list: (list of list of int: [[x0, y0], [x1, y1], [x2, y2], ...]) 图元参数
+    :param algorithm: (string) 绘制使用的算法
+    :param n_steps: (int) 曲线采样的点的个数
+    :param tolerance: (float, 可选) 曲线自适应细分的误差，同draw_curve
+    :param unique: (bool) 为True时去掉重复的像素
+    :return: (iterator of list of int: [x, y]) 像素点坐标
+    """
+    if item_type == 'line':
+        # 不经过内核，编译后端也逐个生成
+        return _line_points(p_list, algorithm)
+    elif item_type == 'polygon':
+        return iter_polygon(p_list, algorithm, unique)
+    elif item_type == 'polyline':
+        return iter_polyline(p_list, algorithm, unique)
+    elif item_type == 'ellipse':
+        # 椭圆的像素数与周长成正比，直接整体计算
+        return iter(draw_ellipse(p_list))
+    elif item_type == 'curve':
+        return iter_curve(p_list, algorithm, n_steps, tolerance, unique)
+    raise ValueError('不支持的图元类型: %s' % item_type)
+
+
+def iter_chunks(pixels, chunk_size=4096):
+    """把像素迭代器按固定大小分组
+
+    :param pixels: (iterator of list of int: [x, y]) 像素点坐标
+    :param chunk_size: (int) 每组的像素个数
+    :return: (iterator of list of list of int) 每次给出至多chunk_size个像素，最后一组可能不满
+    """
+    chunk = []
+    for p in pixels:
+        chunk.append(p)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def pixels_to_spans(pixels):
+    """把像素列表合并成水平的连续段
+
+    :param pixels: (list of list of int: [[x_0, y_0], [x_1, y_1], [x_2, y_2], ...]) 像素点坐标列表
+    :return: (list of list of int: [[y, x_start, x_end], ...]) 每一段覆盖第y行x_start到x_end（含）的像素
+    """
+    rows = {}
+    for x, y in pixels:
+        rows.setdefault(y, []).append(x)
+    result = []
+    for y, xs in rows.items():
+        xs.sort()
+        start = end = xs[0]
+        for x in xs:
+            if x > end + 1:
+                result.append([y, start, end])
+                start = x
+            end = max(end, x)
+        result.append([y, start, end])
+    return result
+
+
+def line_spans(p_list, algorithm):
+    """绘制线段，输出水平连续段
+
+    :param p_list: (list of list of int: [[x0, y0], [x1, y1]]) 线段的起点和终点坐标
+    :param algorithm: (string) 绘制使用的算法，包括'DDA'和'Bresenham'
+    :return: (list of list of int: [[y, x_start, x_end], ...]) 覆盖的像素与draw_line相同
+    """
+    x0, y0 = p_list[0]
+    x1, y1 = p_list[1]
+    dx, dy = abs(x1 - x0), abs(y1 - y0)
+    if algorithm != 'Bresenham' or dx == 0 or dy > dx:
+        return pixels_to_spans(draw_line(p_list, algorithm))
+    # |m| <= 1的Bresenham直线，第i步时y方向累计走过的步数为 c_i = floor((2 dy i + dx - 1) / (2 dx))，
+    # 因此y走第c步的位置是 i = ceil((2 dx c - dx + 1) / (2 dy))，每一段只需O(1)计算
+    if x0 > x1:
+        x0, y0, x1, y1 = x1, y1, x0, y0
+    uy = 1 if y0 < y1 else -1
+    result = []
+    start = 0
+    for c in range(1, dy + 1):
+        end = -((dx - 1 - 2 * dx * c) // (2 * dy))
+        result.append([y0 + uy * (c - 1), x0 + start, x0 + end - 1])
+        start = end
+    result.append([y0 + uy * dy, x0 + start, x1])
+    return result
+
+
+def polygon_spans(p_list, algorithm):
+    """绘制多边形，输出水平连续段
+
+    :param p_list: (list of list of int: [[x0, y0], [x1, y1], [x2, y2], ...]) 多边形的顶点坐标列表
+    :param algorithm: (string) 绘制使用的算法，包括'DDA'和'Bresenham'
+    :return: (list of list of int: [[y, x_start, x_end], ...]) 覆盖的像素与draw_polygon相同
+    """
+    result = []
+    for i in range(len(p_list)):
+        result.extend(line_spans([p_list[i - 1], p_list[i]], algorithm))
+    return result
+
+
+def polyline_spans(p_list, algorithm):
+    """绘制折线，输出水平连续段
+
+    :param p_list: (list of list of int: [[x0, y0], [x1, y1], [x2, y2], ...]) 折线的顶点坐标列表
+    :param algorithm: (string) 绘制使用的算法，包括'DDA'和'Bresenham'
+    :return: (list of list of int: [[y, x_start, x_end], ...]) 覆盖的像素与draw_polyline相同
+    """
+    result = []
+    for i in range(1, len(p_list)):
+        result.extend(line_spans([p_list[i - 1], p_list[i]], algorithm))
+    return result
+
+
+def ellipse_spans(p_list):
+    """绘制椭圆，输出水平连续段
+
+    :param p_list: (list of list of int: [[x0, y0], [x1, y1]]) 椭圆的矩形包围框左上角和右下角顶点坐标
+    :return: (list of list of int: [[y, x_start, x_end], ...]) 覆盖的像素与draw_ellipse相同
+    """
+    return pixels_to_spans(draw_ellipse(p_list))
+
+
+def thicken_spans(spans, width):
+    """用width x width的方形笔刷沿细线扫过，得到粗线覆盖的水平连续段
+
+    :param spans: (list of list of int: [[y, x_start, x_end], ...]) 细线的水平连续段，
+                  可由line_spans、polyline_spans、ellipse_spans或pixels_to_spans(draw_curve(...))得到
+    :param width: (int) 笔刷宽度（像素）
+    :return: (list of list of int: [[y, x_start, x_end], ...]) 粗线的水平连续段，同一行内互不重叠
+    """
+    if width <= 1:
+        return spans
+    # 笔刷以细线像素为中心，宽度为偶数时向右上多出一格
+    lo, hi = (width - 1) // 2, width // 2
+    rows = {}
+    for y, x_start, x_end in spans:
+        for yy in range(y - lo, y + hi + 1):
+            rows.setdefault(yy, []).append((x_start - lo, x_end + hi))
+    result = []
+    for y, segments in rows.items():
+        segments.sort()
+        start, end = segments[0]
+        for a, b in segments:
+            if a > end + 1:
+                result.append([y, start, end])
+                start = a
+            end = max(end, b)
+        result.append([y, start, end])
+    return result
+
+
+def fill_polygon(p_list, y_min=None, y_max=None):
+    """扫描线填充多边形（边表和活性边表，奇偶规则）
+
+    :param p_list: (list of list of int: [[x0, y0], [x1, y1], [x2, y2], ...]) 多边形的顶点坐标列表
+    :param y_min: (int, 可选) 只输出y_min及以上的扫描线，下面的扫描线不计算
+    :param y_max: (int, 可选) 只输出y_max及以下的扫描线
+    :return: (list of list of int: [[y, x_start, x_end], ...]) 多边形内部的水平连续段
+    """
+    # 边表：按边的下端点y分组，每条边记录[上端点y, xn, dx, dy]，当前扫描线与边的交点x = xn / dy，
+    # 每上移一条扫描线xn增加dx，全程只有整数运算。每条边只负责y_low <= y < y_high的扫描线，水平边不参与
+    edge_table = {}
+    for i in range(len(p_list)):
+        xa, ya = p_list[i - 1]
+        xb, yb = p_list[i]
+        if ya == yb:
+            continue
+        if ya > yb:
+            xa, ya, xb, yb = xb, yb, xa, ya
+        edge_table.setdefault(ya, []).append([yb, xa * (yb - ya), xb - xa, yb - ya])
+    if y_min is not None:
+        # 下端点在y_min以下的边直接前进到扫描线y_min
+        for ya in [ya for ya in edge_table if ya < y_min]:
+            for e in edge_table.pop(ya):
+                if e[0] > y_min:
+                    e[1] = e[1] + e[2] * (y_min - ya)
+                    edge_table.setdefault(y_min, []).append(e)
+    result = []
+    active = []  # 活性边表
+    y = 0
+    while active or edge_table:
+        if not active:
+            y = min(edge_table)
+        if y_max is not None and y > y_max:
+            break
+        active.extend(edge_table.pop(y, []))
+        active = [e for e in active if e[0] > y]
+        active.sort(key=lambda e: e[1] / e[3])
+        for left, right in zip(active[0::2], active[1::2]):
+            x_start = -(-left[1] // left[3])  # 向上取整
+            x_end = right[1] // right[3]  # 向下取整
+            if x_start <= x_end:
+                result.append([y, x_start, x_end])
+        for e in active:
+            e[1] = e[1] + e[2]
+        y = y + 1
+    return result
+
+
+class RasterCache:
+    """图元光栅化结果的LRU缓存
+
+    以(图元类型, 控制点, 算法, n_steps, tolerance)为键缓存像素列表，重复绘制没有变化的图元时直接返回缓存，
+    缓存的像素总数超过max_pixels时淘汰最久未使用的结果。返回的列表是共享的，调用者不应修改
+
+    结果与平移无关的图元（见_shape_offset）以平移到标准位置后的控制点为键，
+    只差一个平移的图元（复制的图元、大小相同的椭圆等）共用一份像素：缓存中记录像素所在的位置，
+    位置相同（同一个图元重复绘制）时直接返回缓存的列表，不同时才平移一次并替换缓存
+    """
+
+    def __init__(self, max_pixels=1 << 21):
+        self.max_pixels = max_pixels  # 一个像素[x, y]约占120字节，默认约250MB
+        self.hits = 0
+        self.misses = 0
+        self.pixels = 0  # 当前缓存的像素总数
+        self._entries = {}  # 按最近使用的顺序排列
+
+    def rasterize(self, item_type, p_list, algorithm='', n_steps=1000, tolerance=None):
+        """返回图元的像素列表，与对应的draw_*函数一致（多边形、折线、曲线去掉重复像素）
+
+        :param item_type: (string) 'line'、'polygon'、'polyline'、'ellipse'或'curve'
+        :param p_list: (list of list of int: [[x0, y0], [x1, y1], [x2, y2], ...]) 图元参数
+        :param algorithm: (string) 绘制使用的算法
+        :param n_steps: (int) 曲线采样的点的个数
+        :param tolerance: (float, 可选) 曲线自适应细分的误差，同draw_curve
+        :return: (list of list of int: [[x_0, y_0], [x_1, y_1], [x_2, y_2], ...]) 绘制结果的像素点坐标列表
+        """
+        ox, oy = _shape_offset(item_type, p_list, algorithm)
+        key = (item_type, tuple([(x - ox, y - oy) for x, y in p_list]), algorithm, n_steps, tolerance)
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.hits += 1
+            pixels, offset = entry
+            if offset != (ox, oy):
+                # 缓存的是同一形状在另一个位置的像素，平移过来后替换缓存，同一个图元重复绘制时直接返回
+                dx, dy = ox - offset[0], oy - offset[1]
+                pixels = [[x + dx, y + dy] for x, y in pixels]
+            self._entries[key] = (pixels, (ox, oy))
+            return pixels
+        self.misses += 1
+        pixels = self._rasterize(item_type, p_list, algorithm, n_steps, tolerance)
+        if len(pixels) <= self.max_pixels:
+            self._entries[key] = (pixels, (ox, oy))
+            self.pixels += len(pixels)
+            while self.pixels > self.max_pixels:
+                oldest = next(iter(self._entries))
+                self.pixels -= len(self._entries.pop(oldest)[0])
+        return pixels
+
+    def _rasterize(self, item_type, p_list, algorithm, n_steps, tolerance):
+        if item_type == 'line':
+            return draw_line(p_list, algorithm)
+        elif item_type == 'polygon':
+            return draw_polygon(p_list, algorithm, unique=True)
+        elif item_type == 'polyline':
+            return draw_polyline(p_list, algorithm, unique=True)
+        elif item_type == 'ellipse':
+            return draw_ellipse(p_list)
+        elif item_type == 'curve':
+            return draw_curve(p_list, algorithm, n_steps, tolerance=tolerance, unique=True)
+        raise ValueError('不支持的图元类型: %s' % item_type)
+
+    def clear(self):
+        self._entries.clear()
+        self.pixels = 0
+
+
+def _shape_offset(item_type, p_list, algorithm):
+    """结果与平移无关的图元返回把它平移到标准位置的偏移量(ox, oy)，否则返回(0, 0)
+
+    Bresenham只有整数运算，与平移无关，包围框左上角平移到原点；DDA和曲线的浮点累加与坐标大小有关，不平移。
+    椭圆的2倍坐标按向零取整，中点计算时可能比包围框左边多走半个像素，
+    包围框左上角不小于(1, 1)时向零取整就是向下取整，此时与平移无关，统一平移到(1, 1)
+    """
+    if (item_type == 'line' or item_type == 'polygon' or item_type == 'polyline') and algorithm == 'Bresenham':
+        return min([x for x, y in p_list]), min([y for x, y in p_list])
+    if item_type == 'ellipse':
+        x_min, y_min = min(p_list[0][0], p_list[1][0]), min(p_list[0][1], p_list[1][1])
+        if x_min >= 1 and y_min >= 1:
+            return x_min - 1, y_min - 1
+    return 0, 0
+
+
+raster_cache = RasterCache()
 
 
 def translate(p_list, dx, dy):
@@ -297,9 +928,10 @@ def rotate(p_list, x, y, r):
     # (x+(x1-x)*cos(r)-(y1-y)*sin(r), y+(x1-x)*sin(r)+(y1-y)*cos(r))
     result = []
     r = r * math.pi / 180
+    cos_r, sin_r = math.cos(r), math.sin(r)
     for [x1, y1] in p_list:
-        x1, y1 = x + (x1 - x) * math.cos(r) - (y1 - y) * math.sin(r), \
-                 y + (x1 - x) * math.sin(r) + (y1 - y) * math.cos(r)
+        x1, y1 = x + (x1 - x) * cos_r - (y1 - y) * sin_r, \
+                 y + (x1 - x) * sin_r + (y1 - y) * cos_r
         result.append([int(x1), int(y1)])
     return result
 
@@ -324,6 +956,59 @@ def scale(p_list, x, y, s):
     return result
 
 
+class Affine:
+    """二维仿射变换，即3x3齐次矩阵[[a, b, c], [d, e, f], [0, 0, 1]]:
+    x' = a x + b y + c
+    y' = d x + e y + f
+
+    多次平移、旋转、缩放可以先复合成一个Affine，到绘制时再一次性作用到控制点上，
+    避免每次变换后都取整带来的误差累积
+    """
+
+    def __init__(self, a=1.0, b=0.0, c=0.0, d=0.0, e=1.0, f=0.0):
+        self.a, self.b, self.c = a, b, c
+        self.d, self.e, self.f = d, e, f
+
+    @staticmethod
+    def translation(dx, dy):
+        """平移(dx, dy)"""
+        return Affine(1.0, 0.0, dx, 0.0, 1.0, dy)
+
+    @staticmethod
+    def rotation(x, y, r):
+        """绕点(x, y)旋转r°，方向与rotate相同"""
+        r = r * math.pi / 180
+        cos_r, sin_r = math.cos(r), math.sin(r)
+        return Affine(cos_r, -sin_r, x - x * cos_r + y * sin_r,
+                      sin_r, cos_r, y - x * sin_r - y * cos_r)
+
+    @staticmethod
+    def scaling(x, y, s):
+        """相对于点(x, y)缩放s倍"""
+        return Affine(s, 0.0, x * (1 - s), 0.0, s, y * (1 - s))
+
+    def then(self, other):
+        """复合变换：先做self，再做other，即矩阵乘积other * self"""
+        return Affine(other.a * self.a + other.b * self.d,
+                      other.a * self.b + other.b * self.e,
+                      other.a * self.c + other.b * self.f + other.c,
+                      other.d * self.a + other.e * self.d,
+                      other.d * self.b + other.e * self.e,
+                      other.d * self.c + other.e * self.f + other.f)
+
+    def is_identity(self):
+        return (self.a, self.b, self.c, self.d, self.e, self.f) == (1, 0, 0, 0, 1, 0)
+
+    def apply(self, p_list):
+        """把变换作用到图元参数上
+
+        :param p_list: (list of list of int: [[x0, y0], [x1, y1], [x2, y2], ...]) 图元参数
+        :return: (list of list of int: [[x_0, y_0], [x_1, y_1], [x_2, y_2], ...]) 变换后的图元参数
+        """
+        a, b, c, d, e, f = self.a, self.b, self.c, self.d, self.e, self.f
+        return [[int(a * x + b * y + c), int(d * x + e * y + f)] for x, y in p_list]
+
+
 def clip(p_list, x_min, y_min, x_max, y_max, algorithm):
     """线段裁剪
 
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+# 批量执行指令文件：多个文件在常驻的工作进程中执行，每个文件不再单独付出启动解释器、导入numpy和PIL的开销
+# 用法: python cg_batch.py 输出根目录 指令文件或目录 [指令文件或目录 ...] [-j 进程数]
+# 每个指令文件的结果保存在 输出根目录/文件名(不含扩展名) 中，与单独运行cg_cli.py的结果相同
+import os
+import io
+import time
+import argparse
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
+import cg_cli
+
+
+def collect_scripts(paths):
+    """展开输入：目录取其中所有.txt文件（按文件名排序），文件原样保留
+
+    :param paths: (list of str) 指令文件或目录
+    :return: (list of str) 指令文件路径
+    """
+    scripts = []
+    for path in paths:
+        if os.path.isdir(path):
+            scripts.extend(sorted([os.path.join(path, name) for name in os.listdir(path) if name.endswith('.txt')]))
+        else:
+            scripts.append(path)
+    return scripts
+
+
+def run_script(input_file, output_dir, image_format='bmp', compress_level=6, band_height=0):
+    """在当前进程中执行一个指令文件
+
+    :param input_file: (string) 指令文件路径
+    :param output_dir: (string) 输出目录
+    :param image_format: (string) 输出格式，同cg_cli.save_image
+    :param compress_level: (int) PNG的压缩级别
+    :param band_height: (int) 大于0时按条带绘制，同cg_cli.CommandRunner
+    :return: (tuple: (status, seconds, messages)) status为'ok'或'error'，messages为cg_cli输出的提示和出错信息
+    """
+    start = time.perf_counter()
+    out = io.StringIO()
+    status = 'ok'
+    try:
+        os.makedirs(output_dir, exist_ok=True)
+        with open(input_file, 'r') as fp, contextlib.redirect_stdout(out):
+            cg_cli.CommandRunner(output_dir, image_format=image_format, compress_level=compress_level,
+                                 band_height=band_height).run(fp)
+    except Exception as e:
+        status = 'error'
+        out.write('%s: %s\n' % (type(e).__name__, e))
+    return status, time.perf_counter() - start, out.getvalue()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='用进程池批量执行指令文件')
+    parser.add_argument('output_root', help='输出根目录，每个指令文件输出到其中以文件名命名的子目录')
+    parser.add_argument('inputs', nargs='+', help='指令文件或包含指令文件(*.txt)的目录')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(), help='工作进程数，默认为CPU核数')
+    parser.add_argument('-f', '--format', choices=sorted(cg_cli.IMAGE_EXTENSIONS), default='bmp',
+                        help='输出格式：bmp（默认，不压缩）、png或npy（numpy数组）')
+    parser.add_argument('--compress-level', type=int, choices=range(10), default=6, help='PNG的压缩级别，默认为6')
+    parser.add_argument('-b', '--band-height', type=int, default=0,
+                        help='按这么多行的水平条带绘制并直接写入文件，同cg_cli.py；只支持bmp和npy格式')
+    parser.add_argument('-v', '--verbose', action='store_true', help='同时输出每个文件执行时的提示信息')
+    args = parser.parse_args()
+    if args.band_height > 0 and args.format == 'png':
+        parser.error('--band-height只支持bmp和npy格式')
+
+    scripts = collect_scripts(args.inputs)
+    names = [os.path.splitext(os.path.basename(script))[0] for script in scripts]
+    if len(set(names)) != len(names):
+        parser.error('指令文件重名，输出目录会互相覆盖')
+    backend = cg_cli.select_backend(os.environ.get('CG_BACKEND', 'python'))
+
+    start = time.perf_counter()
+    failed = 0
+    with ProcessPoolExecutor(args.jobs, initializer=cg_cli.select_backend, initargs=(backend,)) as pool:
+        results = pool.map(run_script, scripts, [os.path.join(args.output_root, name) for name in names],
+                           [args.format] * len(scripts), [args.compress_level] * len(scripts),
+                           [args.band_height] * len(scripts))
+        # 按输入顺序报告，每个文件完成后立即输出
+        for script, (status, seconds, messages) in zip(scripts, results):
+            lines = messages.splitlines()
+            print('%-5s %8.3fs  %s%s' % (status, seconds, script, '  (%d条提示)' % len(lines) if lines else ''))
+            if status == 'error':
+                failed = failed + 1
+            if lines and (args.verbose or status == 'error'):
+                for message in lines:
+                    print('      ' + message)
+    print('共%d个文件，失败%d个，用时%.3fs' % (len(scripts), failed, time.perf_counter() - start))
+    exit(1 if failed else 0)
@@ -1,216 +1,666 @@
 #!/usr/bin/env python
 # -*- coding:utf-8 -*-
 
-import sys
 import os
+import queue
+import struct
+import argparse
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
 import cg_algorithms as alg
+import cg_numpy
 import numpy as np
 from PIL import Image
 
-if __name__ == '__main__':
-    input_file = sys.argv[1]
-    output_dir = sys.argv[2]
-    os.makedirs(output_dir, exist_ok=True)
-
-    item_dict = {}
-    pen_color = np.zeros(3, np.uint8)
-    width = 0
-    height = 0
-    lineno = 0
-
-    with open(input_file, 'r') as fp:
-        # line = fp.readline()
-        # while line:
-        for line in fp:
-            line = line.strip().split()
-            lineno = lineno + 1
-            n = len(line)
-            if line[0] == '':
-                continue
-            if line[0] == 'resetCanvas':
-                width = int(line[1])
-                height = int(line[2])
-                item_dict.clear()
-            elif line[0] == 'saveCanvas':
-                if n != 2:
-                    print("第", lineno, "行错误：saveCanvas参数数量错误")
-                    continue
-                save_name = line[1]
-                canvas = np.zeros([height, width, 3], np.uint8)
-                canvas.fill(255)
-                for item_type, p_list, algorithm, color in item_dict.values():
-                    if item_type == 'line':
-                        pixels = alg.draw_line(p_list, algorithm)
-                        for x, y in pixels:
-                            if 0 <= y < height and 0 <= x < width:
-                                # canvas[y, x] = color
-                                canvas[height - 1 - y, x] = color
-                    elif item_type == 'polygon':
-                        pixels = alg.draw_polygon(p_list, algorithm)
-                        for x, y in pixels:
-                            if 0 <= y < height and 0 <= x < width:
-                                # canvas[y, x] = color
-                                canvas[height - 1 - y, x] = color
-                    elif item_type == 'polyline':
-                        pixels = alg.draw_polyline(p_list, algorithm)
-                        for x, y in pixels:
-                            if 0 <= y < height and 0 <= x < width:
-                                # canvas[y, x] = color
-                                canvas[height - 1 - y, x] = color
-                    elif item_type == 'ellipse':
-                        pixels = alg.draw_ellipse(p_list)
-                        for x, y in pixels:
-                            if 0 <= y < height and 0 <= x < width:
-                                # canvas[y, x] = color
-                                # print(height - 1 - y, x)
-                                canvas[height - 1 - y, x] = color
-                    elif item_type == 'curve':
-                        pixels = alg.draw_curve(p_list, algorithm, 5000)
-                        for x, y in pixels:
-                            if 0 <= y < height and 0 <= x < width:
-                                # canvas[y, x] = color
-                                canvas[height - 1 - y, x] = color
-                Image.fromarray(canvas).save(os.path.join(output_dir, save_name + '.bmp'), 'bmp')
-            elif line[0] == 'setColor':
-                if n != 4:
-                    print("第", lineno, "行错误：setColor参数数量错误")
-                    continue
-                pen_color[0] = int(line[1])
-                pen_color[1] = int(line[2])
-                pen_color[2] = int(line[3])
-            elif line[0] == 'drawLine':
-                if n != 7:
-                    print("第", lineno, "行错误：drawLine参数数量错误")
-                    continue
-                item_id = line[1]
-                x0 = int(line[2])
-                y0 = int(line[3])
-                x1 = int(line[4])
-                y1 = int(line[5])
-                algorithm = line[6]
-                if algorithm != 'DDA' and algorithm != 'Bresenham' and algorithm != 'Naive':
-                    print("第", lineno, "行错误：不允许的算法：", algorithm)
-                else:
-                    item_dict[item_id] = ['line', [[x0, y0], [x1, y1]], algorithm, np.array(pen_color)]
-            elif line[0] == 'drawPolygon':
-                if n < 5 or n % 2 == 0:
-                    print("第", lineno, "行错误：drawPolygon参数数量错误")
-                    continue
-                item_id = line[1]
-                t = 2
-                p_list = []
-                n1 = int((n - 3) / 2)
-                algorithm = line[n - 1]
-                for i in range(0, n1):
-                    p_list.append([int(line[i * 2 + 2]), int(line[i * 2 + 3])])
-                if algorithm != 'DDA' and algorithm != 'Bresenham' and algorithm != 'Naive':
-                    print("第", lineno, "行错误：不允许的算法：", algorithm)
-                else:
-                    item_dict[item_id] = ['polygon', p_list, algorithm, np.array(pen_color)]
-            elif line[0] == 'drawPolyline':
-                if n < 5 or n % 2 == 0:
-                    print("第", lineno, "行错误：drawPolyline参数数量错误")
-                    continue
-                item_id = line[1]
-                t = 2
-                p_list = []
-                n1 = int((n - 3) / 2)
-                algorithm = line[n - 1]
-                for i in range(0, n1):
-                    p_list.append([int(line[i * 2 + 2]), int(line[i * 2 + 3])])
-                if algorithm != 'DDA' and algorithm != 'Bresenham' and algorithm != 'Naive':
-                    print("第", lineno, "行错误：不允许的算法：", algorithm)
-                else:
-                    item_dict[item_id] = ['polyline', p_list, algorithm, np.array(pen_color)]
-            elif line[0] == 'drawEllipse':
-                if n != 6:
-                    print("第", lineno, "行错误：drawEllipse参数数量错误")
-                    continue
-                item_id = line[1]
-                x0 = int(line[2])
-                y0 = int(line[3])
-                x1 = int(line[4])
-                y1 = int(line[5])
-                item_dict[item_id] = ['ellipse', [[x0, y0], [x1, y1]], "center", np.array(pen_color)]
-            elif line[0] == 'drawCurve':
-                if n < 5 or n % 2 == 0:
-                    print("drawPolygon参数数量错误")
-                    continue
-                item_id = line[1]
-                t = 2
-                p_list = []
-                n1 = int((n - 3) / 2)
-                algorithm = line[n - 1]
-                for i in range(0, n1):
-                    p_list.append([int(line[i * 2 + 2]), int(line[i * 2 + 3])])
-                if algorithm != 'Bezier' and algorithm != 'B-spline':
-                    print("第", lineno, "行错误：不允许的算法：", algorithm)
-                else:
-                    item_dict[item_id] = ['curve', p_list, algorithm, np.array(pen_color)]
-            elif line[0] == 'translate':
-                if n != 4:
-                    print("第", lineno, "行错误：translate参数数量错误")
-                    continue
-                item_id = line[1]
-                dx = int(line[2])
-                dy = int(line[3])
-                if item_id not in item_dict.keys():
-                    print("第", lineno, "行错误：不存在图元", item_id)
-                else:
-                    p_list = item_dict[item_id][1]
-                    item_dict[item_id][1] = alg.translate(p_list, dx, dy)
-            elif line[0] == 'rotate':
-                if n != 5:
-                    print("第", lineno, "行错误：rotate参数数量错误")
-                    continue
-                item_id = line[1]
-                x = int(line[2])
-                y = int(line[3])
-                r = int(line[4])
-                if item_id not in item_dict.keys():
-                    print("第", lineno, "行错误：不存在图元", item_id)
-                elif item_dict[item_id][0] == 'ellipse':
-                    print("第", lineno, "行错误：禁止对椭圆进行旋转")
-                else:
-                    p_list = item_dict[item_id][1]
-                    item_dict[item_id][1] = alg.rotate(p_list, x, y, -r)
-            elif line[0] == 'scale':
-                if n != 5:
-                    print("第", lineno, "行错误：scale参数数量错误")
-                    continue
-                item_id = line[1]
-                x = int(line[2])
-                y = int(line[3])
-                s = float(line[4])
-                if item_id not in item_dict.keys():
-                    print("第", lineno, "行错误：不存在图元", item_id)
-                else:
-                    p_list = item_dict[item_id][1]
-                    item_dict[item_id][1] = alg.scale(p_list, x, y, s)
-            elif line[0] == 'clip':
-                if n != 7:
-                    print("第", lineno, "行错误：clip参数数量错误")
+
+def item_margin(item_type, stroke):
+    """图元的像素超出控制点包围盒的最大距离
+
+    线段、多边形（包括填充）和曲线（凸包性）的像素都不会超出控制点的包围盒；
+    椭圆的中心可能是半整数，包围框宽度为奇数时2倍坐标向零取整，像素在水平方向可能超出包围框1个像素。
+    粗线再向外扩笔刷宽度
+
+    :return: (tuple of int: (margin_x, margin_y)) 水平、竖直方向的距离
+    """
+    if item_type == 'ellipse':
+        return stroke + 1, stroke
+    return stroke, stroke
+
+
+def culled(p_list, width, height, margin_x=0, margin_y=0):
+    """控制点的包围盒水平向外扩margin_x、竖直向外扩margin_y个像素后与画布不相交时返回True，margin见item_margin"""
+    x_min = min([x for x, y in p_list]) - margin_x
+    x_max = max([x for x, y in p_list]) + margin_x
+    y_min = min([y for x, y in p_list]) - margin_y
+    y_max = max([y for x, y in p_list]) + margin_y
+    return x_max < 0 or y_max < 0 or x_min >= width or y_min >= height
+
+
+def item_edges(item_type, p_list):
+    """线段、多边形、折线的各条边
+
+    :return: (numpy.ndarray, shape (K, 4): [[x0, y0, x1, y1], ...]) 各条边的端点坐标
+    """
+    pts = np.asarray(p_list, np.int64).reshape(-1, 2)
+    if item_type == 'polygon':
+        return np.concatenate([np.roll(pts, 1, axis=0), pts], axis=1)
+    return np.concatenate([pts[:-1], pts[1:]], axis=1)
+
+
+def write_pixels(canvas, pixels, color, x_min=0, y_min=0):
+    """把像素一次性写入画布：先整体筛掉画布外的像素、翻转y，再做一次花式索引赋值
+
+    :param canvas: (numpy.ndarray, shape (height, width, 3)) 画布，第0行是y最大的一行
+    :param pixels: (array-like of int, shape (M, 2)) 像素坐标
+    :param color: (numpy.ndarray) 颜色
+    :param x_min: (int) canvas左下角像素的x坐标，canvas是整张画布的一块时给出
+    :param y_min: (int) canvas左下角像素的y坐标
+    """
+    height, width = canvas.shape[0], canvas.shape[1]
+    p = np.asarray(pixels, np.int64).reshape(-1, 2)
+    x, y = p[:, 0] - x_min, p[:, 1] - y_min
+    inside = (x >= 0) & (x < width) & (y >= 0) & (y < height)
+    canvas[height - 1 - y[inside], x[inside]] = color
+
+
+def write_spans(canvas, spans, color, x_min=0, y_min=0):
+    """按水平连续段填充画布，超出画布的部分截掉，所有段展开成像素后一次赋值
+
+    :param canvas: (numpy.ndarray, shape (height, width, 3)) 画布，第0行是y最大的一行
+    :param spans: (array-like of int, shape (K, 3): [[y, x_start, x_end], ...]) 水平连续段
+    :param color: (numpy.ndarray) 颜色
+    :param x_min: (int) canvas左下角像素的x坐标，同write_pixels
+    :param y_min: (int) canvas左下角像素的y坐标
+    """
+    height, width = canvas.shape[0], canvas.shape[1]
+    s = np.asarray(spans, np.int64).reshape(-1, 3)
+    y, x_start, x_end = s[:, 0] - y_min, np.maximum(s[:, 1] - x_min, 0), np.minimum(s[:, 2] - x_min, width - 1)
+    keep = (y >= 0) & (y < height) & (x_start <= x_end)
+    y, x_start, x_end = y[keep], x_start[keep], x_end[keep]
+    lengths = x_end - x_start + 1
+    # 第i段展开为x_start[i], x_start[i] + 1, ..., x_end[i]
+    starts = np.cumsum(lengths) - lengths
+    cols = np.arange(lengths.sum()) + np.repeat(x_start - starts, lengths)
+    canvas[np.repeat(height - 1 - y, lengths), cols] = color
+
+
+def item_box(item, width, height):
+    """图元可能覆盖的像素范围与画布的交
+
+    :param item: (list) item_dict中的图元
+    :return: (tuple of int: (x_min, y_min, x_max, y_max)) 范围（含边界），与画布不相交时返回None
+    """
+    item_type, p_list, algorithm, color, affine, stroke = item
+    if not affine.is_identity():
+        p_list = cg_numpy.apply_affine(p_list, affine)
+    margin_x, margin_y = item_margin(item_type, stroke)
+    x_min = max(min([x for x, y in p_list]) - margin_x, 0)
+    x_max = min(max([x for x, y in p_list]) + margin_x, width - 1)
+    y_min = max(min([y for x, y in p_list]) - margin_y, 0)
+    y_max = min(max([y for x, y in p_list]) + margin_y, height - 1)
+    if x_min > x_max or y_min > y_max:
+        return None
+    return int(x_min), int(y_min), int(x_max), int(y_max)
+
+
+def draw_item(canvas, item, x_min=0, y_min=0, cache=False):
+    """把图元绘制到画布上，只计算落在画布内的像素
+
+    :param canvas: (numpy.ndarray, shape (height, width, 3)) 画布，或者整张画布中左下角为(x_min, y_min)的一块
+    :param item: (list) item_dict中的图元
+    :param x_min: (int) canvas左下角像素的x坐标
+    :param y_min: (int) canvas左下角像素的y坐标
+    :param cache: (bool) 为True时曲线的像素从cg_algorithms.raster_cache中取，而不是边采样边写入；
+                  同一个图元要分几块绘制时（分块渲染、局部重画）只采样一次
+    """
+    height, width = canvas.shape[0], canvas.shape[1]
+    item_type, p_list, algorithm, color, affine, stroke = item
+    if not affine.is_identity():
+        # 图元上累积的变换在绘制时一次性作用到控制点上
+        p_list = cg_numpy.apply_affine(p_list, affine)
+    if culled([[x - x_min, y - y_min] for x, y in p_list], width, height, *item_margin(item_type, stroke)):
+        # 完全在画布外的图元不绘制
+        return
+    if item_type == 'line' or item_type == 'polygon' or item_type == 'polyline':
+        # 各条边只在画布范围内生成像素，画布外的部分不计算
+        pixels, _ = cg_numpy.draw_lines(item_edges(item_type, p_list), algorithm,
+                                        (x_min - stroke, y_min - stroke,
+                                         x_min + width - 1 + stroke, y_min + height - 1 + stroke))
+    elif item_type == 'filled_polygon':
+        write_spans(canvas, alg.fill_polygon(p_list, y_min, y_min + height - 1), color, x_min, y_min)
+        return
+    elif item_type == 'ellipse':
+        pixels = alg.raster_cache.rasterize('ellipse', p_list)
+    elif item_type == 'curve' and cache:
+        pixels = alg.raster_cache.rasterize('curve', p_list, algorithm, 5000)
+    elif item_type == 'curve':
+        # 曲线边采样边分块写入画布，内存占用与曲线长度无关
+        for chunk in alg.iter_chunks(alg.iter_curve(p_list, algorithm, 5000), 65536):
+            if stroke == 1:
+                write_pixels(canvas, chunk, color, x_min, y_min)
+            else:
+                spans = cg_numpy.pixels_to_spans(chunk).tolist()
+                write_spans(canvas, alg.thicken_spans(spans, stroke), color, x_min, y_min)
+        return
+    else:
+        return
+    if stroke == 1:
+        write_pixels(canvas, pixels, color, x_min, y_min)
+    else:
+        # 笔刷覆盖不到画布的像素不参与加粗
+        p = np.asarray(pixels, np.int64).reshape(-1, 2)
+        near = ((p[:, 0] >= x_min - stroke) & (p[:, 0] < x_min + width + stroke)
+                & (p[:, 1] >= y_min - stroke) & (p[:, 1] < y_min + height + stroke))
+        spans = cg_numpy.pixels_to_spans(p[near]).tolist()
+        write_spans(canvas, alg.thicken_spans(spans, stroke), color, x_min, y_min)
+
+
+def select_backend(name):
+    """选择cg_algorithms的后端，'numba'时先导入cg_jit注册编译的内核，没有安装Numba时仍使用纯Python实现"""
+    if name == 'numba':
+        import cg_jit
+    return alg.set_backend(name)
+
+
+# 输出格式 -> 扩展名
+IMAGE_EXTENSIONS = {'bmp': '.bmp', 'png': '.png', 'npy': '.npy'}
+
+
+def save_image(canvas, path, image_format='bmp', compress_level=6):
+    """保存画布
+
+    :param canvas: (numpy.ndarray, shape (height, width, 3)) 画布
+    :param path: (string) 文件路径，扩展名与格式对应
+    :param image_format: (string) 'bmp'（不压缩）、'png'或'npy'（numpy数组原样保存）
+    :param compress_level: (int) PNG的压缩级别，0到9
+    """
+    if image_format == 'npy':
+        np.save(path, canvas)
+    elif image_format == 'png':
+        Image.fromarray(canvas).save(path, 'png', compress_level=compress_level)
+    else:
+        Image.fromarray(canvas).save(path, 'bmp')
+
+
+class ImageWriter:
+    """在后台线程中按提交顺序编码、写出画布，队列满时提交的一方等待"""
+
+    def __init__(self, image_format='bmp', compress_level=6, queue_size=4):
+        self.image_format = image_format
+        self.compress_level = compress_level
+        self.queue = queue.Queue(queue_size)
+        self.error = None
+        self.thread = threading.Thread(target=self.work, daemon=True)
+        self.thread.start()
+
+    def work(self):
+        while True:
+            task = self.queue.get()
+            if task is None:
+                return
+            canvas, path = task
+            try:
+                save_image(canvas, path, self.image_format, self.compress_level)
+            except Exception as e:
+                if self.error is None:
+                    self.error = e
+
+    def write(self, canvas, path):
+        """提交canvas当前内容的副本，之后canvas可以继续修改"""
+        if self.error is not None:
+            raise self.error
+        self.queue.put((canvas.copy(), path))
+
+    def close(self):
+        """等待已提交的全部写完，写出时的异常在这里抛出"""
+        self.queue.put(None)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+
+def render_snapshot(width, height, items, path, image_format='bmp', compress_level=6):
+    """在新画布上按顺序绘制items并保存，供进程池并行渲染saveCanvas的快照
+
+    :param width: (int) 画布宽度
+    :param height: (int) 画布高度
+    :param items: (list of list) 保存时item_dict中各图元的副本，按绘制顺序排列
+    :param path: (string) 输出文件路径
+    :param image_format: (string) 输出格式，同save_image
+    :param compress_level: (int) PNG的压缩级别
+    :return: (string) path
+    """
+    canvas = np.zeros([height, width, 3], np.uint8)
+    canvas.fill(255)
+    for item in items:
+        draw_item(canvas, item)
+    save_image(canvas, path, image_format, compress_level)
+    return path
+
+
+def render_bands(width, height, items, path, band_height, image_format='bmp'):
+    """按水平条带逐条绘制并直接写入文件，内存中只有一个条带，整张画布从不分配，适合内存放不下的超大画布
+
+    BMP的扫描线从下往上存放，条带从y=0开始向上绘制；npy从上往下存放，条带从最上面开始。
+    输出与save_image保存整张画布的结果逐字节相同
+
+    :param width: (int) 画布宽度
+    :param height: (int) 画布高度
+    :param items: (list of list) 图元，按绘制顺序排列
+    :param path: (string) 输出文件路径
+    :param band_height: (int) 每个条带的行数
+    :param image_format: (string) 'bmp'或'npy'，PNG无法按行写出
+    :return: (string) path
+    """
+    boxes = [(item, item_box(item, width, height)) for item in items]
+    bands = [(y0, min(y0 + band_height, height) - 1) for y0 in range(0, height, band_height)]
+    stride = (width * 3 + 3) & ~3  # BMP每行补齐到4字节
+    with open(path, 'wb') as fp:
+        if image_format == 'npy':
+            np.lib.format.write_array_header_1_0(fp, {'descr': np.lib.format.dtype_to_descr(np.dtype(np.uint8)),
+                                                      'fortran_order': False, 'shape': (height, width, 3)})
+            bands.reverse()
+        else:
+            # 同PIL：BITMAPFILEHEADER + BITMAPINFOHEADER，24位，分辨率96dpi（3780像素/米）
+            fp.write(struct.pack('<2sIHHIIiiHHIIiiII', b'BM', 54 + stride * height, 0, 0, 54,
+                                 40, width, height, 1, 24, 0, stride * height, 3780, 3780, 0, 0))
+        for y0, y1 in bands:
+            band = np.empty([y1 - y0 + 1, width, 3], np.uint8)
+            band.fill(255)
+            for item, box in boxes:
+                if box is not None and box[1] <= y1 and box[3] >= y0:
+                    draw_item(band, item, 0, y0, cache=True)
+            if image_format == 'npy':
+                fp.write(band.tobytes())
+            else:
+                # 从下往上，RGB换成BGR
+                rows = np.zeros([y1 - y0 + 1, stride], np.uint8)
+                rows[:, :width * 3] = band[::-1, :, ::-1].reshape(y1 - y0 + 1, width * 3)
+                fp.write(rows.tobytes())
+    return path
+
+
+def render_tile(shm_name, width, height, region, items):
+    """在共享内存中的画布上绘制一块，供进程池并行渲染大画布
+
+    :param shm_name: (string) 存放画布的SharedMemory的名字
+    :param width: (int) 画布宽度
+    :param height: (int) 画布高度
+    :param region: (tuple of int: (x_min, y_min, x_max, y_max)) 这一块的范围（含边界），各块互不重叠
+    :param items: (list of list) 与这一块相交的图元，按绘制顺序排列
+    """
+    # 共享内存由主进程创建和释放，这里只是打开使用
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        x0, y0, x1, y1 = region
+        view = np.ndarray((height, width, 3), np.uint8, buffer=shm.buf)[height - 1 - y1:height - y0, x0:x1 + 1]
+        for item in items:
+            draw_item(view, item, x0, y0, cache=True)
+        del view
+    finally:
+        shm.close()
+
+
+def int_points(tokens):
+    """把坐标参数一次性转为整数并两两配对
+
+    :param tokens: (list of str) x0 y0 x1 y1 ...
+    :return: (list of list of int: [[x0, y0], [x1, y1], ...]) 点坐标列表
+    """
+    v = map(int, tokens)
+    return [[x, y] for x, y in zip(v, v)]
+
+
+# 新建的图元都没有变换，共用同一个不会被修改的Affine
+IDENTITY = alg.Affine()
+
+
+class CommandRunner:
+    """逐行执行指令文件，保存画布、图元和画笔的状态
+
+    指令通过commands表分派到对应的方法，方法的参数为一行按空白分开的各项和行号。
+    给出进程池pool时，saveCanvas只把当时的图元快照交给pool渲染，不等待结果，继续执行后面的指令；
+    同时给出tile_size时改为把画布分成tile_size x tile_size的块，由pool中的进程分块绘制到共享内存中。
+    queue_size大于0时，画布交给后台线程编码写出，最多排队queue_size张；为0时在saveCanvas中直接写出。
+    band_height大于0时不再保留整张画布，每次saveCanvas按band_height行的条带绘制并直接写入文件（见render_bands），
+    给出pool时各次保存的条带绘制交给pool
+    """
+
+    LINE_ALGORITHMS = ('DDA', 'Bresenham', 'Naive')
+    CURVE_ALGORITHMS = ('Bezier', 'B-spline')
+    CLIP_ALGORITHMS = ('Cohen-Sutherland', 'Liang-Barsky')
+
+    def __init__(self, output_dir, pool=None, tile_size=0, image_format='bmp', compress_level=6, queue_size=4,
+                 band_height=0):
+        self.output_dir = output_dir
+        self.pool = pool
+        self.tile_size = tile_size
+        self.image_format = image_format
+        self.compress_level = compress_level
+        self.band_height = band_height
+        self.writer = None
+        if queue_size > 0 and band_height == 0:
+            # 按条带保存时直接写入文件，不需要后台线程
+            self.writer = ImageWriter(image_format, compress_level, queue_size)
+        self.pending = {}  # 输出路径 -> 尚未完成的渲染任务
+        self.item_dict = {}
+        # 画布在两次saveCanvas之间保留，dirty记录期间新建、变换、裁剪或删除的图元，
+        # boxes记录每个图元上次绘制时覆盖的范围
+        self.canvas = None
+        self.dirty = set()
+        self.boxes = {}
+        # 同一颜色的图元共用一个颜色数组，这些数组都不会被修改
+        self.pen_color = np.zeros(3, np.uint8)
+        self.colors = {}
+        self.pen_width = 1
+        self.width = 0
+        self.height = 0
+        self.commands = {
+            'resetCanvas': self.reset_canvas,
+            'saveCanvas': self.save_canvas,
+            'setColor': self.set_color,
+            'setPenWidth': self.set_pen_width,
+            'drawLine': self.draw_line,
+            'drawPolygon': self.draw_poly,
+            'drawPolyline': self.draw_poly,
+            'fillPolygon': self.fill_polygon,
+            'drawEllipse': self.draw_ellipse,
+            'drawCurve': self.draw_poly,
+            'translate': self.translate,
+            'rotate': self.rotate,
+            'scale': self.scale,
+            'clip': self.clip,
+        }
+
+    def run(self, fp):
+        """执行fp中的全部指令，空行跳过"""
+        commands = self.commands
+        try:
+            for lineno, line in enumerate(fp, 1):
+                line = line.split()
+                if not line:
                     continue
-                item_id = line[1]
-                x0 = int(line[2])
-                y0 = int(line[3])
-                x1 = int(line[4])
-                y1 = int(line[5])
-                algorithm = line[6]
-                if algorithm != 'Cohen-Sutherland' and algorithm != 'Liang-Barsky':
-                    print("第", lineno, "行错误：不存在算法", algorithm)
-                elif item_id not in item_dict.keys():
-                    print("第", lineno, "行错误：不存在图元", item_id)
-                elif item_dict[item_id][0] != 'line':
-                    print("第", lineno, "行错误：禁止对线段以外的图元进行裁剪")
+                command = commands.get(line[0])
+                if command is None:
+                    print("第", lineno, "行错误：未知的指令")
                 else:
-                    p_list = item_dict[item_id][1]
-                    ret = alg.clip(p_list, x0, min(y0, y1), x1, max(y0, y1), algorithm)
-                    if ret:
-                        item_dict[item_id][1] = ret
-                    else:
-                        del item_dict[item_id]
+                    command(line, lineno)
+        finally:
+            # 出错时也要写完已经保存的画布，并结束后台线程
+            self.join()
+
+    def join(self):
+        """等待所有交给进程池和后台线程的saveCanvas完成，渲染和写出中的异常在这里抛出"""
+        try:
+            for future in self.pending.values():
+                future.result()
+        finally:
+            self.pending.clear()
+            if self.writer is not None:
+                writer, self.writer = self.writer, None
+                writer.close()
+
+    def write(self, canvas, path):
+        if self.writer is not None:
+            self.writer.write(canvas, path)
+        else:
+            save_image(canvas, path, self.image_format, self.compress_level)
+
+    def add_item(self, item_id, item_type, p_list, algorithm):
+        self.item_dict[item_id] = [item_type, p_list, algorithm, self.pen_color, IDENTITY, self.pen_width]
+        self.dirty.add(item_id)
+
+    def find_item(self, item_id, lineno):
+        """返回要变换的图元，不存在时报错并返回None"""
+        item = self.item_dict.get(item_id)
+        if item is None:
+            print("第", lineno, "行错误：不存在图元", item_id)
+        return item
+
+    def reset_canvas(self, line, lineno):
+        self.width = int(line[1])
+        self.height = int(line[2])
+        self.item_dict.clear()
+        self.canvas = None
+        self.dirty.clear()
+        self.boxes.clear()
+
+    def save_canvas(self, line, lineno):
+        if len(line) != 2:
+            print("第", lineno, "行错误：saveCanvas参数数量错误")
+            return
+        width, height, item_dict, boxes = self.width, self.height, self.item_dict, self.boxes
+        path = os.path.join(self.output_dir, line[1] + IMAGE_EXTENSIONS[self.image_format])
+        if self.pool is not None and self.tile_size > 0:
+            self.render_tiles(path)
+            return
+        if self.pool is None and self.band_height > 0:
+            render_bands(width, height, list(item_dict.values()), path, self.band_height, self.image_format)
+            self.dirty.clear()
+            return
+        if self.pool is not None:
+            # 图元列表之后会被变换、裁剪原地修改，快照复制每个图元的列表；其中的控制点、颜色、Affine都不会被原地修改
+            if path in self.pending:
+                # 同名的保存按顺序完成，后一次覆盖前一次
+                self.pending.pop(path).result()
+            items = [list(item) for item in item_dict.values()]
+            if self.band_height > 0:
+                self.pending[path] = self.pool.submit(render_bands, width, height, items, path,
+                                                      self.band_height, self.image_format)
             else:
-                print("第", lineno, "行错误：未知的指令")
-            # ...
-            # line = fp.readline()
+                self.pending[path] = self.pool.submit(render_snapshot, width, height, items, path,
+                                                      self.image_format, self.compress_level)
+            return
+        if self.canvas is None:
+            # 第一次保存，整张画布绘制
+            self.canvas = np.zeros([height, width, 3], np.uint8)
+            self.canvas.fill(255)
+            for item_id, item in item_dict.items():
+                draw_item(self.canvas, item)
+                boxes[item_id] = item_box(item, width, height)
+        else:
+            # 只重画上次保存之后改动过的图元原来和现在所在的区域，
+            # 区域内按item_dict的顺序重画所有与之相交的图元，保持覆盖关系
+            regions = []
+            for item_id in self.dirty:
+                regions.append(boxes.pop(item_id, None))
+                if item_id in item_dict:
+                    boxes[item_id] = item_box(item_dict[item_id], width, height)
+                    regions.append(boxes[item_id])
+            redraw = []
+            for x0, y0, x1, y1 in [r for r in regions if r is not None]:
+                redraw.append(((x0, y0, x1, y1), [item for item_id, item in item_dict.items()
+                                                  if boxes[item_id] is not None
+                                                  and boxes[item_id][0] <= x1 and boxes[item_id][2] >= x0
+                                                  and boxes[item_id][1] <= y1 and boxes[item_id][3] >= y0]))
+            if sum([len(items) for region, items in redraw]) >= len(item_dict):
+                # 要重画的图元比整张画布还多时直接重画整张画布
+                redraw = [((0, 0, width - 1, height - 1), list(item_dict.values()))]
+            for (x0, y0, x1, y1), items in redraw:
+                view = self.canvas[height - 1 - y1:height - y0, x0:x1 + 1]
+                view.fill(255)
+                for item in items:
+                    draw_item(view, item, x0, y0, cache=True)
+        self.dirty.clear()
+        self.write(self.canvas, path)
+
+    def render_tiles(self, path):
+        """分块并行绘制整张画布并保存，每一块只绘制包围盒与它相交的图元"""
+        width, height, tile = self.width, self.height, self.tile_size
+        shm = shared_memory.SharedMemory(create=True, size=max(width * height * 3, 1))
+        try:
+            canvas = np.ndarray((height, width, 3), np.uint8, buffer=shm.buf)
+            canvas.fill(255)
+            boxes = [(item, item_box(item, width, height)) for item in self.item_dict.values()]
+            futures = []
+            for y0 in range(0, height, tile):
+                for x0 in range(0, width, tile):
+                    x1, y1 = min(x0 + tile, width) - 1, min(y0 + tile, height) - 1
+                    items = [item for item, box in boxes if box is not None
+                             and box[0] <= x1 and box[2] >= x0 and box[1] <= y1 and box[3] >= y0]
+                    if items:
+                        futures.append(self.pool.submit(render_tile, shm.name, width, height, (x0, y0, x1, y1), items))
+            for future in futures:
+                future.result()
+            self.write(canvas, path)
+            del canvas
+        finally:
+            shm.close()
+            shm.unlink()
+        self.dirty.clear()
+
+    def set_color(self, line, lineno):
+        if len(line) != 4:
+            print("第", lineno, "行错误：setColor参数数量错误")
+            return
+        color = tuple(map(int, line[1:4]))
+        if color not in self.colors:
+            self.colors[color] = np.array(color, np.uint8)
+        self.pen_color = self.colors[color]
+
+    def set_pen_width(self, line, lineno):
+        # setPenWidth w，之后绘制的图元使用w x w的方形笔刷
+        if len(line) != 2:
+            print("第", lineno, "行错误：setPenWidth参数数量错误")
+            return
+        self.pen_width = max(1, int(line[1]))
+
+    def draw_line(self, line, lineno):
+        if len(line) != 7:
+            print("第", lineno, "行错误：drawLine参数数量错误")
+            return
+        p_list = int_points(line[2:6])
+        if line[6] not in self.LINE_ALGORITHMS:
+            print("第", lineno, "行错误：不允许的算法：", line[6])
+        else:
+            self.add_item(line[1], 'line', p_list, line[6])
+
+    def draw_poly(self, line, lineno):
+        # drawPolygon、drawPolyline、drawCurve: id x0 y0 x1 y1 ... algorithm
+        n = len(line)
+        if n < 5 or n % 2 == 0:
+            print("第", lineno, "行错误：" + line[0] + "参数数量错误")
+            return
+        p_list = int_points(line[2:n - 1])
+        algorithm = line[n - 1]
+        if line[0] == 'drawCurve':
+            item_type, algorithms = 'curve', self.CURVE_ALGORITHMS
+        else:
+            item_type, algorithms = 'polygon' if line[0] == 'drawPolygon' else 'polyline', self.LINE_ALGORITHMS
+        if algorithm not in algorithms:
+            print("第", lineno, "行错误：不允许的算法：", algorithm)
+        else:
+            self.add_item(line[1], item_type, p_list, algorithm)
+
+    def fill_polygon(self, line, lineno):
+        # fillPolygon id x0 y0 x1 y1 x2 y2 ...，扫描线填充，没有算法参数
+        n = len(line)
+        if n < 4 or n % 2 == 1:
+            print("第", lineno, "行错误：fillPolygon参数数量错误")
+            return
+        self.add_item(line[1], 'filled_polygon', int_points(line[2:]), 'Scanline')
+
+    def draw_ellipse(self, line, lineno):
+        if len(line) != 6:
+            print("第", lineno, "行错误：drawEllipse参数数量错误")
+            return
+        self.add_item(line[1], 'ellipse', int_points(line[2:6]), "center")
+
+    def translate(self, line, lineno):
+        if len(line) != 4:
+            print("第", lineno, "行错误：translate参数数量错误")
+            return
+        dx, dy = map(int, line[2:4])
+        item = self.find_item(line[1], lineno)
+        if item is not None:
+            item[4] = item[4].then(alg.Affine.translation(dx, dy))
+            self.dirty.add(line[1])
+
+    def rotate(self, line, lineno):
+        if len(line) != 5:
+            print("第", lineno, "行错误：rotate参数数量错误")
+            return
+        x, y, r = map(int, line[2:5])
+        item = self.find_item(line[1], lineno)
+        if item is None:
+            return
+        if item[0] == 'ellipse':
+            print("第", lineno, "行错误：禁止对椭圆进行旋转")
+        else:
+            item[4] = item[4].then(alg.Affine.rotation(x, y, -r))
+            self.dirty.add(line[1])
+
+    def scale(self, line, lineno):
+        if len(line) != 5:
+            print("第", lineno, "行错误：scale参数数量错误")
+            return
+        x, y = map(int, line[2:4])
+        s = float(line[4])
+        item = self.find_item(line[1], lineno)
+        if item is not None:
+            item[4] = item[4].then(alg.Affine.scaling(x, y, s))
+            self.dirty.add(line[1])
+
+    def clip(self, line, lineno):
+        if len(line) != 7:
+            print("第", lineno, "行错误：clip参数数量错误")
+            return
+        item_id = line[1]
+        x0, y0, x1, y1 = map(int, line[2:6])
+        algorithm = line[6]
+        if algorithm not in self.CLIP_ALGORITHMS:
+            print("第", lineno, "行错误：不存在算法", algorithm)
+            return
+        item = self.find_item(item_id, lineno)
+        if item is None:
+            return
+        if item[0] != 'line':
+            print("第", lineno, "行错误：禁止对线段以外的图元进行裁剪")
+            return
+        self.dirty.add(item_id)
+        # 裁剪需要实际的端点坐标，先把累积的变换作用上去
+        p_list = cg_numpy.apply_affine(item[1], item[4])
+        item[4] = IDENTITY
+        ret = alg.clip(p_list, x0, min(y0, y1), x1, max(y0, y1), algorithm)
+        if ret:
+            item[1] = ret
+        else:
+            del self.item_dict[item_id]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='执行指令文件，保存saveCanvas的结果')
+    parser.add_argument('input_file', help='指令文件')
+    parser.add_argument('output_dir', help='输出目录')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='并行渲染saveCanvas的进程数，默认为1，即每次saveCanvas都同步绘制')
+    parser.add_argument('-t', '--tile-size', type=int, default=0,
+                        help='与--jobs一起使用，把每张画布分成这么大的块并行绘制，适合很大的画布')
+    parser.add_argument('-f', '--format', choices=sorted(IMAGE_EXTENSIONS), default='bmp',
+                        help='输出格式：bmp（默认，不压缩）、png或npy（numpy数组）')
+    parser.add_argument('--compress-level', type=int, choices=range(10), default=6, help='PNG的压缩级别，默认为6')
+    parser.add_argument('--queue-size', type=int, default=4,
+                        help='后台写出线程最多排队的画布数，默认为4，为0时在saveCanvas中直接写出')
+    parser.add_argument('-b', '--band-height', type=int, default=0,
+                        help='按这么多行的水平条带绘制并直接写入文件，内存中不保留整张画布，适合内存放不下的超大画布；'
+                             '只支持bmp和npy格式')
+    args = parser.parse_args()
+    if args.tile_size > 0 and args.jobs <= 1:
+        parser.error('--tile-size需要与--jobs（大于1）一起使用')
+    if args.band_height > 0 and args.format == 'png':
+        parser.error('--band-height只支持bmp和npy格式')
+    if args.band_height > 0 and args.tile_size > 0:
+        parser.error('--band-height和--tile-size不能同时使用')
+    os.makedirs(args.output_dir, exist_ok=True)
+    # CG_BACKEND=numba时使用cg_jit中编译的内核
+    backend = select_backend(os.environ.get('CG_BACKEND', 'python'))
+
+    with open(args.input_file, 'r') as fp:
+        if args.jobs > 1:
+            with ProcessPoolExecutor(args.jobs, initializer=select_backend, initargs=(backend,)) as pool:
+                CommandRunner(args.output_dir, pool, args.tile_size,
+                              args.format, args.compress_level, args.queue_size, args.band_height).run(fp)
+        else:
+            CommandRunner(args.output_dir, None, 0, args.format, args.compress_level, args.queue_size,
+                          args.band_height).run(fp)
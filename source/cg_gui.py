@@ -2,6 +2,7 @@
 # -*- coding:utf-8 -*-
 
 import sys
+import os
 import math
 import cg_algorithms as alg
 from typing import Optional
@@ -60,6 +61,12 @@ class MyCanvas(QGraphicsView):
         self.temp_algorithm = algorithm
         # self.temp_id = item_id
 
+    def start_fill_polygon(self, algorithm):
+        if self.drawing != 0:
+            return
+        self.status = 'fill_polygon'
+        self.temp_algorithm = algorithm
+
     def start_draw_ellipse(self, algorithm):
         if self.drawing != 0:
             return
@@ -190,7 +197,7 @@ class MyCanvas(QGraphicsView):
             self.scene().addItem(self.temp_item)
             last_act = ['line', self.temp_id]
             self.action_stack.append(last_act)
-        elif self.status == 'polygon':
+        elif self.status == 'polygon' or self.status == 'fill_polygon':
             if self.temp_item is None:
                 self.temp_item = MyItem(self.temp_id, self.status, [[x, y], [x, y]],
                                         self.temp_algorithm, self.pen_color, self.pen_width, 0)
@@ -273,7 +280,7 @@ class MyCanvas(QGraphicsView):
     def mouseDoubleClickEvent(self, event: QMouseEvent) -> None:  # 不解决双击会有很多问题
         # print("double click")
         self.double_click = 1
-        if self.status == 'polygon' and self.temp_item:
+        if (self.status == 'polygon' or self.status == 'fill_polygon') and self.temp_item:
             self.temp_item.p_list[-1] = self.temp_item.p_list[0]
             self.temp_item.end = 1
             self.item_dict[self.temp_id] = self.temp_item
@@ -303,7 +310,7 @@ class MyCanvas(QGraphicsView):
         y = int(pos.y())
         if self.status == 'line':
             self.temp_item.p_list[1] = [x, y]
-        elif self.status == 'polygon':
+        elif self.status == 'polygon' or self.status == 'fill_polygon':
             self.temp_item.p_list[-1] = [x, y]
         elif self.status == 'ellipse':
             self.temp_item.p_list[1] = [x, y]
@@ -361,7 +368,7 @@ class MyCanvas(QGraphicsView):
             self.item_dict[self.temp_id] = self.temp_item
             self.list_widget.addItem(self.temp_id)
             self.finish_draw()
-        elif self.status == 'polygon':
+        elif self.status == 'polygon' or self.status == 'fill_polygon':
             threshold = 10
             if abs(self.temp_item.p_list[-1][0] - self.temp_item.p_list[0][0]) + abs(
                     self.temp_item.p_list[-1][0] - self.temp_item.p_list[0][0]) <= threshold and len(
@@ -426,31 +433,40 @@ class MyItem(QGraphicsItem):
 
     def paint(self, painter: QPainter, option: QStyleOptionGraphicsItem,
               widget: Optional[QWidget] = ...) -> None:  # mark
+        # 图元没有变化时直接取cg_algorithms中缓存的像素，重绘不再重新光栅化
         item_pixels = []
+        item_spans = []
         if self.item_type == 'line' and self.p_list:
-            item_pixels = alg.draw_line(self.p_list, self.algorithm)
+            item_pixels = alg.raster_cache.rasterize('line', self.p_list, self.algorithm)
         elif self.item_type == 'polygon':
             if self.end == 1:
-                item_pixels = alg.draw_polygon(self.p_list, self.algorithm)
+                item_pixels = alg.raster_cache.rasterize('polygon', self.p_list, self.algorithm)
+            else:
+                item_pixels = alg.raster_cache.rasterize('polyline', self.p_list, self.algorithm)
+        elif self.item_type == 'fill_polygon':
+            if self.end == 1:
+                item_spans = alg.fill_polygon(self.p_list)
             else:
-                item_pixels = alg.draw_polyline(self.p_list, self.algorithm)
+                item_pixels = alg.raster_cache.rasterize('polyline', self.p_list, 'Bresenham')
         elif self.item_type == 'ellipse':
-            item_pixels = alg.draw_ellipse(self.p_list)
+            item_pixels = alg.raster_cache.rasterize('ellipse', self.p_list)
         elif self.item_type == 'curve':
-            item_pixels = alg.draw_curve(self.p_list, self.algorithm)
+            item_pixels = alg.raster_cache.rasterize('curve', self.p_list, self.algorithm, tolerance=0.5)
         elif self.item_type == 'polyline':
-            item_pixels = alg.draw_polyline(self.p_list, self.algorithm)
+            item_pixels = alg.raster_cache.rasterize('polyline', self.p_list, self.algorithm)
         elif self.item_type == 'pencil':
-            item_pixels = alg.draw_polyline(self.p_list, 'Bresenham')
+            item_pixels = alg.raster_cache.rasterize('polyline', self.p_list, 'Bresenham')
         elif self.item_type == 'clip':  # 画一个矩形而已
             x_min, y_min, x_max, y_max = self.p_list[0][0], self.p_list[0][1], self.p_list[1][0], self.p_list[1][1]
             item_pixels = alg.draw_polygon([[x_min, y_min], [x_min, y_max], [x_max, y_max], [x_max, y_min]],
                                            'Bresenham')
-        for p in item_pixels:
-            # painter.setPen(self.item_color)
-            pen = QPen(self.item_color, self.pen_width, Qt.SolidLine)
-            painter.setPen(pen)
-            painter.drawPoint(*p)
+        if item_pixels:
+            # 粗线由cg_algorithms按笔刷宽度算出覆盖的水平段，不再对每个像素新建一个宽画笔
+            item_spans = alg.thicken_spans(alg.pixels_to_spans(item_pixels), self.pen_width)
+        # 按水平段绘制，每段一次drawLine
+        painter.setPen(QPen(self.item_color, 1, Qt.SolidLine))
+        for y, x_start, x_end in item_spans:
+            painter.drawLine(x_start, y, x_end, y)
         if self.selected:
             painter.setPen(QColor(255, 0, 0))
             if self.p_list:
@@ -468,7 +484,7 @@ class MyItem(QGraphicsItem):
             h = max(y0, y1) - y
             return QRectF(x - 1, y - 1, w + 2, h + 2)
         elif self.item_type == 'polygon' or self.item_type == 'polyline' or self.item_type == 'curve' \
-                or self.item_type == 'pencil':
+                or self.item_type == 'pencil' or self.item_type == 'fill_polygon':
             x_min, y_min = self.p_list[0]
             x_max, y_max = self.p_list[0]
             for x, y in self.p_list:
@@ -486,7 +502,7 @@ class MyItem(QGraphicsItem):
             x1, y1 = self.p_list[1]
             return [(x0 + x1) / 2, (y0 + y1) / 2]
         elif self.item_type == 'polygon' or self.item_type == 'polyline' or self.item_type == 'curve' \
-                or self.item_type == 'pencil':
+                or self.item_type == 'pencil' or self.item_type == 'fill_polygon':
             x_min, y_min = self.p_list[0]
             x_max, y_max = self.p_list[0]
             for x, y in self.p_list:
@@ -555,6 +571,7 @@ class MainWindow(QMainWindow):
         polygon_menu = draw_menu.addMenu('多边形')
         polygon_dda_act = polygon_menu.addAction('DDA')
         polygon_bresenham_act = polygon_menu.addAction('Bresenham')
+        fill_polygon_act = draw_menu.addAction('填充多边形')
         ellipse_act = draw_menu.addAction('椭圆')
         curve_menu = draw_menu.addMenu('曲线')
         curve_bezier_act = curve_menu.addAction('Bezier')
@@ -590,6 +607,7 @@ class MainWindow(QMainWindow):
         polygon_bresenham_act.triggered.connect(self.polygon_bresenham_action)
         polyline_dda_act.triggered.connect(self.polyline_dda_action)
         polyline_bresenham_act.triggered.connect(self.polyline_bresenham_action)
+        fill_polygon_act.triggered.connect(self.fill_polygon_action)
         ellipse_act.triggered.connect(self.ellipse_action)
         curve_bezier_act.triggered.connect(self.curve_bezier_action)
         curve_b_spline_act.triggered.connect(self.curve_b_spline_action)
@@ -718,6 +736,14 @@ class MainWindow(QMainWindow):
         self.list_widget.clearSelection()
         self.canvas_widget.clear_selection()
 
+    def fill_polygon_action(self):
+        if self.canvas_widget.drawing != 0:
+            return
+        self.canvas_widget.start_fill_polygon('Scanline')
+        self.statusBar().showMessage('扫描线算法填充多边形')
+        self.list_widget.clearSelection()
+        self.canvas_widget.clear_selection()
+
     def polyline_dda_action(self):
         if self.canvas_widget.drawing != 0:
             return
@@ -810,6 +836,10 @@ class MainWindow(QMainWindow):
 
 
 if __name__ == '__main__':
+    # CG_BACKEND=numba时使用cg_jit中编译的内核，没有安装Numba时仍使用纯Python实现
+    if os.environ.get('CG_BACKEND') == 'numba':
+        import cg_jit
+    alg.set_backend(os.environ.get('CG_BACKEND', 'python'))
     app = QApplication(sys.argv)
     mw = MainWindow()
     mw.show()
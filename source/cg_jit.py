@@ -0,0 +1,343 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+# cg_algorithms.py只允许依赖math库，这里放用Numba编译的内核，导入时注册为cg_algorithms的'numba'后端
+# 没有安装Numba时什么也不注册，cg_algorithms.set_backend('numba')会静默地退回纯Python实现
+# 每个内核的浮点运算顺序都与cg_algorithms中的实现相同，输出逐像素一致
+import numpy as np
+import cg_algorithms as alg
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+def _line(x0, y0, x1, y1, dda):
+    """draw_line的DDA和Bresenham算法
+
+    :return: (numpy.ndarray, shape (N, 2)) 像素坐标，顺序与draw_line相同
+    """
+    dx, dy = abs(x1 - x0), abs(y1 - y0)
+    result = np.empty((max(dx, dy) + 1, 2), np.int64)
+    if dda:
+        if dx == 0 and dy == 0:
+            result[0, 0], result[0, 1] = x0, y0
+        elif dy <= dx:
+            k = (y1 - y0) / (x1 - x0)
+            if x0 > x1:
+                x0, y0, x1, y1 = x1, y1, x0, y0
+            y = float(y0)
+            for i in range(dx + 1):
+                result[i, 0], result[i, 1] = x0 + i, int(y)
+                y = y + k
+        else:
+            k = (x1 - x0) / (y1 - y0)
+            if y0 > y1:
+                x0, y0, x1, y1 = x1, y1, x0, y0
+            x = float(x0)
+            for i in range(dy + 1):
+                result[i, 0], result[i, 1] = int(x), y0 + i
+                x = x + k
+        return result
+    if dx == 0:
+        for i in range(dy + 1):
+            result[i, 0], result[i, 1] = x0, min(y0, y1) + i
+    elif dy == 0:
+        for i in range(dx + 1):
+            result[i, 0], result[i, 1] = min(x0, x1) + i, y0
+    elif dx == dy:
+        if x0 > x1:
+            x0, y0, x1, y1 = x1, y1, x0, y0
+        uy = 1 if y0 < y1 else -1
+        for i in range(dx + 1):
+            result[i, 0], result[i, 1] = x0 + i, y0 + uy * i
+    elif dy < dx:
+        if x0 > x1:
+            x0, y0, x1, y1 = x1, y1, x0, y0
+        uy = 1 if y0 < y1 else -1
+        y = y0
+        p = 2 * dy - dx
+        result[0, 0], result[0, 1] = x0, y0
+        for i in range(1, dx + 1):
+            if p <= 0:
+                p = p + 2 * dy
+            else:
+                y = y + uy
+                p = p + 2 * dy - 2 * dx
+            result[i, 0], result[i, 1] = x0 + i, y
+    else:
+        if y0 > y1:
+            x0, y0, x1, y1 = x1, y1, x0, y0
+        ux = 1 if x0 < x1 else -1
+        x = x0
+        p = 2 * dx - dy
+        result[0, 0], result[0, 1] = x0, y0
+        for i in range(1, dy + 1):
+            if p < 0:
+                p = p + 2 * dx
+            else:
+                x = x + ux
+                p = p + 2 * dx - 2 * dy
+            result[i, 0], result[i, 1] = x, y0 + i
+    return result
+
+
+def _half(v):
+    """向零取整的v / 2"""
+    return (v + 1) >> 1 if v < 0 else v >> 1
+
+
+def _ellipse(x0, y0, x1, y1):
+    """draw_ellipse的中点算法（包围框高度不为0）
+
+    :return: (numpy.ndarray, shape (N, 2)) 像素坐标，顺序与draw_ellipse相同
+    """
+    a, b = abs(x1 - x0), abs(y1 - y0)
+    result = np.empty((4 * (a + b) + 16, 2), np.int64)
+    n = 0
+    if a == b and a % 2 == 0:
+        # 圆心和半径都是整数的圆，8路对称
+        cx, cy, r = (x0 + x1) // 2, (y0 + y1) // 2, a // 2
+        x, y = 0, r
+        p = 5 - 4 * r
+        while True:
+            for sx, sy, swap in ((1, 1, False), (-1, 1, False), (1, -1, False), (-1, -1, False),
+                                 (1, 1, True), (-1, 1, True), (1, -1, True), (-1, -1, True)):
+                if swap:
+                    result[n, 0], result[n, 1] = cx + sx * y, cy + sy * x
+                else:
+                    result[n, 0], result[n, 1] = cx + sx * x, cy + sy * y
+                n += 1
+            if y <= x:
+                break
+            x = x + 1
+            if p < 0:
+                p = p + 8 * x + 4
+            else:
+                y = y - 1
+                p = p + 8 * x - 8 * y + 4
+        return result[:n]
+    sx, sy = x0 + x1, y0 + y1
+    aa, bb = a * a, b * b
+    x, y2 = 0, b
+    result[0, 0], result[0, 1] = _half(sx), _half(sy + y2)
+    result[1, 0], result[1, 1] = _half(sx), _half(sy - y2)
+    n = 2
+    p1 = 4 * bb - 2 * aa * b + aa
+    while aa * y2 > 2 * bb * x:
+        xr, xl = _half(sx + 2 * x), _half(sx - 2 * x)
+        yt, yb = _half(sy + y2), _half(sy - y2)
+        result[n, 0], result[n, 1] = xr, yt
+        result[n + 1, 0], result[n + 1, 1] = xl, yt
+        result[n + 2, 0], result[n + 2, 1] = xr, yb
+        result[n + 3, 0], result[n + 3, 1] = xl, yb
+        n += 4
+        x = x + 1
+        if p1 < 0:
+            p1 = p1 + 8 * bb * x + 4 * bb
+        else:
+            y2 = y2 - 2
+            p1 = p1 + 8 * bb * x - 4 * aa * y2 + 4 * bb
+    p2 = bb * (2 * x + 1) * (2 * x + 1) + aa * (y2 - 2) * (y2 - 2) - aa * bb
+    while y2 >= 0:
+        xr, xl = _half(sx + 2 * x), _half(sx - 2 * x)
+        yt, yb = _half(sy + y2), _half(sy - y2)
+        result[n, 0], result[n, 1] = xr, yt
+        result[n + 1, 0], result[n + 1, 1] = xl, yt
+        result[n + 2, 0], result[n + 2, 1] = xr, yb
+        result[n + 3, 0], result[n + 3, 1] = xl, yb
+        n += 4
+        y2 = y2 - 2
+        if p2 > 0:
+            p2 = p2 - 4 * aa * y2 + 4 * aa
+        else:
+            x = x + 1
+            p2 = p2 + 8 * bb * x - 4 * aa * y2 + 4 * aa
+    yc = _half(sy)
+    while 2 * x <= a:
+        result[n, 0], result[n, 1] = _half(sx + 2 * x), yc
+        result[n + 1, 0], result[n + 1, 1] = _half(sx - 2 * x), yc
+        n += 2
+        x = x + 1
+    return result[:n]
+
+
+def _de_casteljau(px, py, u):
+    """cg_algorithms._de_casteljau"""
+    x, y = px.astype(np.float64), py.astype(np.float64)
+    n = len(px) - 1
+    for r in range(1, n + 1):
+        for i in range(0, n - r + 1):
+            x[i] = (1 - u) * x[i] + u * x[i + 1]
+            y[i] = (1 - u) * y[i] + u * y[i + 1]
+    return x[0], y[0]
+
+
+def _cox_de_boor(px, py, u):
+    """cg_algorithms._cox_de_boor"""
+    n = len(px) - 1
+    b = np.zeros(n + 4)
+    for i in range(0, n + 4):
+        if i <= u < i + 1:
+            b[i] = 1.0
+    for k in range(2, 5):
+        for i in range(0, n + 5 - k):
+            b[i] = b[i] * (u - i) / (k - 1) + b[i + 1] * (i + k - u) / (k - 1)
+    x, y = 0.0, 0.0
+    for i in range(0, n + 1):
+        x = x + px[i] * b[i]
+        y = y + py[i] * b[i]
+    return x, y
+
+
+def _near_integer(x, y):
+    return abs(x - round(x)) < 1e-6 or abs(y - round(y)) < 1e-6
+
+
+def _curve_samples(px, py, b_spline, n_steps):
+    """cg_algorithms._curve_points的n_steps采样（不含自适应细分）
+
+    :return: (numpy.ndarray, shape (N, 2)) 取整后的采样点
+    """
+    n = len(px) - 1
+    samples = np.empty((n_steps + 3, 2), np.int64)
+    m = 0
+    if not b_spline:
+        b = np.empty(n + 1)
+        for t in range(0, n_steps + 1):
+            u = t / n_steps
+            # 与cg_algorithms._bezier_basis相同的递推，从高到低原地更新
+            b[0] = 1.0
+            for r in range(1, n + 1):
+                b[r] = u * b[r - 1]
+                for i in range(r - 1, 0, -1):
+                    b[i] = (1 - u) * b[i] + u * b[i - 1]
+                b[0] = (1 - u) * b[0]
+            x, y = 0.0, 0.0
+            for i in range(n + 1):
+                x = x + b[i] * px[i]
+                y = y + b[i] * py[i]
+            if _near_integer(x, y):
+                x, y = _de_casteljau(px, py, u)
+            samples[m, 0], samples[m, 1] = int(x), int(y)
+            m += 1
+        return samples[:m]
+    if n < 3:
+        return samples[:0]
+    step = (n - 2) / n_steps
+    u = 3.0
+    while u <= n + 1:
+        j = min(int(u), n)
+        t = u - j
+        w0 = (((-1 * t + 3) * t - 3) * t + 1) / 6
+        w1 = (((3 * t - 6) * t + 0) * t + 4) / 6
+        w2 = (((-3 * t + 3) * t + 3) * t + 1) / 6
+        w3 = (((1 * t + 0) * t + 0) * t + 0) / 6
+        x = px[j - 3] * w0 + px[j - 2] * w1 + px[j - 1] * w2 + px[j] * w3
+        y = py[j - 3] * w0 + py[j - 2] * w1 + py[j - 1] * w2 + py[j] * w3
+        if _near_integer(x, y):
+            x, y = _cox_de_boor(px, py, u)
+        u = u + step
+        if m == len(samples):
+            samples = np.concatenate((samples, np.empty((len(samples), 2), np.int64)))
+        samples[m, 0], samples[m, 1] = int(x), int(y)
+        m += 1
+    return samples[:m]
+
+
+def _curve(px, py, b_spline, n_steps):
+    """draw_curve的n_steps采样，相邻采样点用Bresenham直线连接（不去重）
+
+    :return: (numpy.ndarray, shape (N, 2)) 像素坐标，顺序与draw_curve相同
+    """
+    samples = _curve_samples(px, py, b_spline, n_steps)
+    total = 0
+    for i in range(len(samples)):
+        j = max(i - 1, 0)
+        total += max(abs(samples[i, 0] - samples[j, 0]), abs(samples[i, 1] - samples[j, 1])) + 1
+    result = np.empty((total, 2), np.int64)
+    n = 0
+    for i in range(len(samples)):
+        j = max(i - 1, 0)
+        line = _line(samples[j, 0], samples[j, 1], samples[i, 0], samples[i, 1], False)
+        result[n:n + len(line)] = line
+        n += len(line)
+    return result
+
+
+if numba is not None:
+    # 内核之间互相调用，要按依赖顺序编译；cache=True把编译结果缓存在__pycache__中
+    _jit = numba.njit(cache=True)
+    _line = _jit(_line)
+    _half = _jit(_half)
+    _ellipse = _jit(_ellipse)
+    _de_casteljau = _jit(_de_casteljau)
+    _cox_de_boor = _jit(_cox_de_boor)
+    _near_integer = _jit(_near_integer)
+    _curve_samples = _jit(_curve_samples)
+    _curve = _jit(_curve)
+
+
+def _result(pixels, out):
+    """把内核输出的(N, 2)数组转为draw_*的返回值：out为None时返回列表，否则展平写入out，不经过像素列表"""
+    if out is None:
+        return pixels.tolist()
+    typecode = getattr(out, 'typecode', None)
+    if typecode is not None:
+        # array.array按其元素类型直接追加数组的内存
+        out.frombytes(pixels.astype(typecode).tobytes())
+    else:
+        out.extend(pixels.ravel().tolist())
+    return out
+
+
+def draw_line(p_list, algorithm, out=None):
+    """'line'内核，同cg_algorithms.draw_line（只支持'DDA'和'Bresenham'）"""
+    (x0, y0), (x1, y1) = p_list[0], p_list[1]
+    return _result(_line(int(x0), int(y0), int(x1), int(y1), algorithm == 'DDA'), out)
+
+
+def draw_ellipse(p_list, out=None):
+    """'ellipse'内核，同cg_algorithms.draw_ellipse（包围框高度不为0）"""
+    (x0, y0), (x1, y1) = p_list[0], p_list[1]
+    return _result(_ellipse(int(x0), int(y0), int(x1), int(y1)), out)
+
+
+def draw_curve(p_list, algorithm, n_steps, out=None):
+    """'curve'内核，同不去重的cg_algorithms.draw_curve(p_list, algorithm, n_steps, out)"""
+    if algorithm != 'Bezier' and algorithm != 'B-spline':
+        return [] if out is None else out
+    pts = np.asarray(p_list, np.int64).reshape(-1, 2)
+    return _result(_curve(pts[:, 0].copy(), pts[:, 1].copy(), algorithm == 'B-spline', n_steps), out)
+
+
+if numba is not None:
+    alg.register_backend('numba', {'line': draw_line, 'ellipse': draw_ellipse, 'curve': draw_curve})
+
+
+if __name__ == '__main__':
+    # 对随机图元比较两个后端的输出
+    import random
+    if alg.set_backend('numba') != 'numba':
+        print('没有安装Numba')
+        exit(0)
+    random.seed(2020)
+    cases = []
+    for _ in range(2000):
+        p = [[random.randint(-100, 700), random.randint(-100, 700)] for _ in range(random.randint(2, 8))]
+        cases.append(('line', p[:2], random.choice(['DDA', 'Bresenham']), 0))
+        cases.append(('ellipse', p[:2], '', 0))
+        cases.append(('curve', p, random.choice(['Bezier', 'B-spline']), random.choice([100, 1000, 5000])))
+    for item_type, p_list, algorithm, n_steps in cases:
+        outputs = []
+        for backend in ('python', 'numba'):
+            alg.set_backend(backend)
+            if item_type == 'line':
+                outputs.append(alg.draw_line(p_list, algorithm))
+            elif item_type == 'ellipse':
+                outputs.append(alg.draw_ellipse(p_list))
+            else:
+                outputs.append(alg.draw_curve(p_list, algorithm, n_steps))
+        assert outputs[0] == outputs[1], (item_type, p_list, algorithm)
+    print('python与numba后端的输出一致，共%d个图元' % len(cases))
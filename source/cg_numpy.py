@@ -0,0 +1,305 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+# cg_algorithms.py只允许依赖math库，这里放依赖numpy的批量版本，供cg_cli.py使用
+# 所有函数的输出都与cg_algorithms中对应的逐个调用逐像素一致
+import numpy as np
+
+
+def draw_lines(segments, algorithm, window=None):
+    """批量绘制线段，结果与对每条线段调用cg_algorithms.draw_line逐像素一致
+
+    :param segments: (array-like of int, shape (N, 4): [[x0, y0, x1, y1], ...]) 每条线段的起点和终点坐标
+    :param algorithm: (string) 绘制使用的算法，包括'DDA'、'Bresenham'和'Naive'
+    :param window: (tuple of int: (x_min, y_min, x_max, y_max), 可选) 给出时只生成落在窗口附近的那一段像素，
+                   窗口外的部分不计算；与先画整条线再丢掉窗口外像素相比，窗口内的像素完全相同
+    :return: (pixels, offsets) pixels为int32的(M, 2)像素坐标数组，
+             第i条线段的像素为pixels[offsets[i]:offsets[i + 1]]，顺序与draw_line相同
+    """
+    seg = np.asarray(segments, dtype=np.int64).reshape(-1, 4)
+    x0, y0, x1, y1 = seg[:, 0], seg[:, 1], seg[:, 2], seg[:, 3]
+    dx, dy = np.abs(x1 - x0), np.abs(y1 - y0)
+    # 每条线段选定一个主方向（逐像素+1取样的方向），与draw_line中各算法的分支对应
+    if algorithm == 'Naive':
+        x_major = x0 != x1
+    elif algorithm == 'DDA':
+        x_major = dy <= dx
+    elif algorithm == 'Bresenham':
+        x_major = (dy <= dx) & (dx != 0)
+    else:
+        raise ValueError('不支持的算法: %s' % algorithm)
+    # 按主方向交换端点，保证主方向坐标递增
+    swap = np.where(x_major, x0 > x1, y0 > y1)
+    sx, sy = np.where(swap, x1, x0), np.where(swap, y1, y0)
+    ex, ey = np.where(swap, x0, x1), np.where(swap, y0, y1)
+    major_start = np.where(x_major, sx, sy)
+    minor_start = np.where(x_major, sy, sx)
+    major_len = np.where(x_major, ex - sx, ey - sy)
+    minor_delta = np.where(x_major, ey - sy, ex - sx)
+
+    # 每条线段实际生成的是主方向上第first到第last步的像素
+    first = np.zeros(len(seg), np.int64)
+    last = major_len.copy()
+    if window is not None:
+        first, last = _window_steps(window, x_major, major_start, minor_start, major_len, minor_delta)
+    lengths = np.maximum(last - first + 1, 0)
+    offsets = np.zeros(len(seg) + 1, np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    total = int(offsets[-1])
+    seg_id = np.repeat(np.arange(len(seg)), lengths)
+    step = np.arange(total, dtype=np.int64) - offsets[seg_id] + first[seg_id]
+
+    if algorithm == 'Naive':
+        # y = int(y0 + k * (x - x0))，竖直线段k不参与计算
+        k = minor_delta / np.where(major_len == 0, 1, major_len)
+        minor = np.where(x_major[seg_id], minor_start[seg_id] + k[seg_id] * step, minor_start[seg_id])
+        minor = np.trunc(minor).astype(np.int64)
+    elif algorithm == 'DDA':
+        minor = _dda_minor(minor_start, minor_delta, major_len, offsets, first, last, total)
+    else:  # Bresenham
+        # 决策参数p的递推可以写成闭式：第i步时次方向累计走过的步数c_i
+        # |m| <= 1 (p <= 0 不走): c_i = floor((2 dy i + dx - 1) / (2 dx))
+        # |m| > 1  (p < 0 不走):  c_i = floor((2 dx i + dy) / (2 dy))
+        a = np.abs(minor_delta)[seg_id]
+        b = major_len[seg_id]
+        bias = np.where(x_major[seg_id], b - 1, b)
+        c = (2 * a * step + bias) // np.maximum(2 * b, 1)
+        minor = minor_start[seg_id] + np.sign(minor_delta)[seg_id] * c
+
+    major = major_start[seg_id] + step
+    pixels = np.empty((total, 2), np.int32)
+    xm = x_major[seg_id]
+    pixels[:, 0] = np.where(xm, major, minor)
+    pixels[:, 1] = np.where(xm, minor, major)
+    return pixels, offsets
+
+
+def _window_steps(window, x_major, major_start, minor_start, major_len, minor_delta):
+    """求每条线段落在窗口附近的步数范围[first, last]，范围为空时first > last
+
+    主方向坐标直接限制在窗口内；次方向上各算法的像素与理想直线相差不到1，
+    因此把理想直线限制在窗口向外扩1个像素的范围内，保证不漏掉窗口内的像素
+    """
+    x_min, y_min, x_max, y_max = window
+    lo = np.where(x_major, x_min, y_min) - major_start
+    hi = np.where(x_major, x_max, y_max) - major_start
+    first = np.maximum(0, lo)
+    last = np.minimum(major_len, hi)
+    n_lo = np.where(x_major, y_min, x_min) - 1 - minor_start
+    n_hi = np.where(x_major, y_max, x_max) + 1 - minor_start
+    # 理想直线的次方向偏移为 step * minor_delta / major_len
+    d = np.where(minor_delta == 0, 1, minor_delta)
+    a = np.where(minor_delta > 0, n_lo, n_hi) * major_len
+    b = np.where(minor_delta > 0, n_hi, n_lo) * major_len
+    flat = minor_delta == 0
+    first = np.where(flat, first, np.maximum(first, -(-a // d) - 1))
+    last = np.where(flat, last, np.minimum(last, b // d + 1))
+    empty = flat & ((n_lo > 0) | (n_hi < 0))
+    last = np.where(empty, first - 1, last)
+    return first, last
+
+
+# DDA逐段累加时每次处理的步数，限制很长线段（包括窗口前被跳过的部分）的临时内存
+DDA_CHUNK = 1 << 16
+
+
+def _dda_minor(minor_start, minor_delta, major_len, offsets, first, last, total):
+    """DDA次方向坐标，按draw_line中y = y + k的顺序从起点逐步累加，保证浮点误差完全一致
+
+    np.cumsum按顺序逐个相加，每条线段用cumsum([y0, k, k, ...])一次算出，很长的线段分块计算并接续累加值；
+    窗口之前的步也要累加过去，但不生成像素
+    """
+    k = minor_delta / np.where(major_len == 0, 1, major_len)
+    minor = np.empty(total, np.int64)
+    for i in np.flatnonzero(last >= first).tolist():
+        f, n_steps, base = int(first[i]), int(last[i]) + 1, int(offsets[i])
+        acc = float(minor_start[i])
+        for j in range(0, n_steps, DDA_CHUNK):
+            n = min(DDA_CHUNK, n_steps - j)
+            values = np.full(n, k[i])
+            values[0] = acc
+            np.cumsum(values, out=values)
+            acc = values[-1] + k[i]
+            if j + n > f:
+                lo = max(f - j, 0)
+                minor[base + j + lo - f:base + j + n - f] = np.trunc(values[lo:])
+    return minor
+
+
+def pixel_array(buffer):
+    """把cg_algorithms中draw_*函数以out=array('i')写出的展平缓冲区看作(N, 2)的像素数组，不复制数据
+
+    :param buffer: (array of int) draw_*函数的out参数
+    :return: (numpy.ndarray, shape (N, 2)) 像素坐标数组
+    """
+    return np.frombuffer(buffer, np.intc).reshape(-1, 2)
+
+
+def apply_affine(p_list, affine):
+    """cg_algorithms.Affine.apply的向量化版本，结果与之逐点一致
+
+    :param p_list: (list of list of int: [[x0, y0], [x1, y1], [x2, y2], ...]) 图元参数
+    :param affine: (cg_algorithms.Affine) 复合后的仿射变换
+    :return: (list of list of int: [[x_0, y_0], [x_1, y_1], [x_2, y_2], ...]) 变换后的图元参数
+    """
+    pts = np.asarray(p_list, np.float64).reshape(-1, 2)
+    x, y = pts[:, 0], pts[:, 1]
+    # 逐元素按a * x + b * y + c的顺序计算，不用矩阵乘法，避免与纯Python版本的舍入不一致
+    result = np.empty(pts.shape, np.int64)
+    result[:, 0] = np.trunc(affine.a * x + affine.b * y + affine.c)
+    result[:, 1] = np.trunc(affine.d * x + affine.e * y + affine.f)
+    return result.tolist()
+
+
+def _outcode(x, y, x_min, y_min, x_max, y_max):
+    """Cohen-Sutherland区域码：1左 2右 4下 8上"""
+    return (x < x_min) * 1 | (x > x_max) * 2 | (y < y_min) * 4 | (y > y_max) * 8
+
+
+def clip_lines(segments, x_min, y_min, x_max, y_max, algorithm):
+    """批量线段裁剪，结果与对每条线段调用cg_algorithms.clip完全一致（包括取整）
+
+    :param segments: (array-like of int, shape (N, 4): [[x0, y0, x1, y1], ...]) 每条线段的起点和终点坐标
+    :param x_min: 裁剪窗口左上角x坐标
+    :param y_min: 裁剪窗口左上角y坐标
+    :param x_max: 裁剪窗口右下角x坐标
+    :param y_max: 裁剪窗口右下角y坐标
+    :param algorithm: (string) 使用的裁剪算法，包括'Cohen-Sutherland'和'Liang-Barsky'
+    :return: (clipped, keep) keep为(N,)的bool数组，表示线段是否有部分留在窗口内；
+             clipped为留下的线段裁剪后的端点，int64的(K, 4)数组，K = keep.sum()
+    """
+    seg = np.asarray(segments, dtype=np.int64).reshape(-1, 4)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if algorithm == 'Cohen-Sutherland':
+            keep, out = _clip_cohen_sutherland(seg, x_min, y_min, x_max, y_max)
+        elif algorithm == 'Liang-Barsky':
+            keep, out = _clip_liang_barsky(seg, x_min, y_min, x_max, y_max)
+        else:
+            raise ValueError('不支持的算法: %s' % algorithm)
+    return np.trunc(out[keep]).astype(np.int64), keep
+
+
+def _clip_cohen_sutherland(seg, x_min, y_min, x_max, y_max):
+    x0, y0, x1, y1 = (seg[:, i].astype(np.float64) for i in range(4))
+    pos0 = _outcode(x0, y0, x_min, y_min, x_max, y_max)
+    pos1 = _outcode(x1, y1, x_min, y_min, x_max, y_max)
+    inside = (pos0 == 0) & (pos1 == 0)
+    keep = inside | ((pos0 & pos1) == 0)
+    # 求交点时分母为0说明剩下的部分平行于这条边界且在边界外（scalar版本中除零），整条线段丢弃
+    degenerate = np.zeros(len(seg), bool)
+    # 依次检查起点和左右、上下边界的交点
+    m = ~inside & (pos0 & 1 != 0)
+    degenerate |= m & (x1 == x0)
+    y0 = np.where(m, y0 + (y1 - y0) * (x_min - x0) / (x1 - x0), y0)
+    x0 = np.where(m, x_min, x0)
+    m = ~inside & (pos0 & 1 == 0) & (pos0 & 2 != 0)
+    degenerate |= m & (x1 == x0)
+    y0 = np.where(m, y0 + (y1 - y0) * (x_max - x0) / (x1 - x0), y0)
+    x0 = np.where(m, x_max, x0)
+    pos0 = np.where(inside, pos0, _outcode(x0, y0, x_min, y_min, x_max, y_max))
+    m = ~inside & (pos0 & 8 != 0)
+    degenerate |= m & (y1 == y0)
+    x0 = np.where(m, x0 + (x1 - x0) * (y_max - y0) / (y1 - y0), x0)
+    y0 = np.where(m, y_max, y0)
+    m = ~inside & (pos0 & 8 == 0) & (pos0 & 4 != 0)
+    degenerate |= m & (y1 == y0)
+    x0 = np.where(m, x0 + (x1 - x0) * (y_min - y0) / (y1 - y0), x0)
+    y0 = np.where(m, y_min, y0)
+    pos0 = np.where(inside, pos0, _outcode(x0, y0, x_min, y_min, x_max, y_max))
+    # 起点裁剪后，终点已在窗口内或两端点在同侧的不再处理终点
+    done = inside | ((pos0 == 0) & (pos1 == 0))
+    keep &= done | ((pos0 & pos1) == 0)
+    # 另一个端点
+    m = ~done & (pos1 & 1 != 0)
+    degenerate |= m & (x1 == x0)
+    y1 = np.where(m, y0 + (y1 - y0) * (x_min - x0) / (x1 - x0), y1)
+    x1 = np.where(m, x_min, x1)
+    m = ~done & (pos1 & 1 == 0) & (pos1 & 2 != 0)
+    degenerate |= m & (x1 == x0)
+    y1 = np.where(m, y0 + (y1 - y0) * (x_max - x0) / (x1 - x0), y1)
+    x1 = np.where(m, x_max, x1)
+    pos1 = _outcode(x1, y1, x_min, y_min, x_max, y_max)
+    m = ~done & (pos1 & 8 != 0)
+    degenerate |= m & (y1 == y0)
+    x1 = np.where(m, x0 + (x1 - x0) * (y_max - y0) / (y1 - y0), x1)
+    y1 = np.where(m, y_max, y1)
+    m = ~done & (pos1 & 8 == 0) & (pos1 & 4 != 0)
+    degenerate |= m & (y1 == y0)
+    x1 = np.where(m, x0 + (x1 - x0) * (y_min - y0) / (y1 - y0), x1)
+    y1 = np.where(m, y_min, y1)
+    return keep & ~degenerate, np.stack([x0, y0, x1, y1], axis=1)
+
+
+def _clip_liang_barsky(seg, x_min, y_min, x_max, y_max):
+    x0, y0, x1, y1 = seg[:, 0], seg[:, 1], seg[:, 2], seg[:, 3]
+    dx, dy = x0 - x1, y0 - y1
+    # 裁剪条件:
+    # x_min <= x1 + u dx <= x_max
+    # y_min <= y1 + u dy <= y_max
+    p = [-dx, dx, -dy, dy]
+    q = [x1 - x_min, x_max - x1, y1 - y_min, y_max - y1]
+    vertical = dx == 0
+    horizontal = (dy == 0) & ~vertical
+    # 与裁剪边界平行的线段，先判断是否完全在边界外，再求另一方向的参数范围
+    keep = ~(vertical & ((q[0] < 0) | (q[1] < 0))) & ~(horizontal & ((q[2] < 0) | (q[3] < 0)))
+    ua = np.where(vertical, q[2] / p[2], q[0] / p[0])
+    ub = np.where(vertical, q[3] / p[3], q[1] / p[1])
+    u1 = np.maximum(0, np.minimum(ua, ub))
+    u2 = np.minimum(1, np.maximum(ua, ub))
+    # 一般情况
+    general = ~vertical & ~horizontal
+    g1, g2 = np.zeros(len(seg)), np.ones(len(seg))
+    for k in range(0, 4):
+        r = q[k] / p[k]
+        g1 = np.where(p[k] < 0, np.maximum(r, g1), g1)
+        g2 = np.where(p[k] > 0, np.minimum(r, g2), g2)
+    u1, u2 = np.where(general, g1, u1), np.where(general, g2, u2)
+    # 退化为一个点的线段（scalar版本中会触发assert），点在窗口内时保留
+    point = vertical & (dy == 0)
+    u1 = np.where(point, 0, u1)
+    u2 = np.where(point, 0, u2)
+    keep &= ~point | ((q[2] >= 0) & (q[3] >= 0))
+    keep &= ~(u1 > u2)
+    return keep, np.stack([x1 + u1 * dx, y1 + u1 * dy, x1 + u2 * dx, y1 + u2 * dy], axis=1)
+
+
+def pixels_to_spans(pixels):
+    """cg_algorithms.pixels_to_spans的向量化版本
+
+    :param pixels: (array-like of int, shape (M, 2)) 像素坐标
+    :return: (numpy.ndarray, shape (K, 3): [[y, x_start, x_end], ...]) 水平连续段，按y、x排序
+    """
+    p = np.asarray(pixels, np.int64).reshape(-1, 2)
+    if len(p) == 0:
+        return np.empty((0, 3), np.int64)
+    order = np.lexsort((p[:, 0], p[:, 1]))
+    x, y = p[order, 0], p[order, 1]
+    # 换行或者x不连续（重复的像素不算）的位置开始新的一段
+    brk = np.ones(len(x), bool)
+    brk[1:] = (y[1:] != y[:-1]) | (x[1:] > x[:-1] + 1)
+    starts = np.flatnonzero(brk)
+    ends = np.append(starts[1:], len(x)) - 1
+    return np.stack([y[starts], x[starts], x[ends]], axis=1)
+
+
+if __name__ == '__main__':
+    # 对随机线段比较clip_lines与逐条调用cg_algorithms.clip的结果
+    import random
+    import cg_algorithms as alg
+    random.seed(2020)
+    window = (-30, -20, 40, 50)
+    segments = [[random.randint(-100, 100) for _ in range(4)] for _ in range(20000)]
+    # 起点裁剪到一条边界后与另一条边界平行的线段，scalar版本中除零，应当丢弃
+    segments += [[-52, 53, -30, -98], [-52, -98, -30, 53], [60, 53, 40, -98], [-30, 60, 80, 60]]
+    segments = [s for s in segments if s[:2] != s[2:]]
+    for algorithm in ('Cohen-Sutherland', 'Liang-Barsky'):
+        clipped, keep = clip_lines(segments, *window, algorithm)
+        clipped = iter(clipped.tolist())
+        for s, k in zip(segments, keep):
+            try:
+                expected = alg.clip([s[:2], s[2:]], *window, algorithm)
+            except ZeroDivisionError:
+                expected = []
+            got = next(clipped) if k else []
+            assert expected == ([got[:2], got[2:]] if got else []), (algorithm, s, expected, got)
+    print('clip_lines与cg_algorithms.clip的结果一致，共%d条线段' % len(segments))